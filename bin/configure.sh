@@ -1,7 +1,7 @@
 
 #!/bin/sh
 
-sudo apt install -y openjdk-8-jre screen htop git vim
+sudo apt install -y openjdk-8-jre screen htop git vim lbzip2
 
 wget https://repo.anaconda.com/miniconda/Miniconda3-latest-Linux-x86_64.sh
 chmod +x Miniconda3-latest-Linux-x86_64.sh
@@ -9,9 +9,9 @@ chmod +x Miniconda3-latest-Linux-x86_64.sh
 source ~/.bashrc
 rm -rf Miniconda3-latest-Linux-x86_64.sh
 
-conda install -y pandas numpy networkx nltk spacy pyspark beautifulsoup4 scikit-learn
+conda install -y pandas numpy networkx nltk spacy pyspark beautifulsoup4 scikit-learn pyarrow
 conda install pytorch cudatoolkit=9.0 -c pytorch
-pip install -U newspaper3k textstat pandarallel simpletransformers
+pip install -U newspaper3k textstat pandarallel simpletransformers hnswlib
 python -m nltk.downloader punkt vader_lexicon #-d /path/to/nltk_data
 python -m spacy download en_core_web_lg 
 
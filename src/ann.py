@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import hnswlib
+import numpy as np
+import pandas as pd
+
+from instrumentation import span, traced
+from sources import input_stamp
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+index_dir = sciclops_dir + 'cache/ann/'
+
+#HNSW parameters: graph degree, build-time and query-time beam width
+M = 16
+EF_CONSTRUCTION = 200
+EF = 64
+K = 10
+#the claims and papers matrices of matrix_preparation and their index columns
+MATRICES = {'claims': ('cache/claims_embeddings.tsv.bz2', ['url', 'claim', 'popularity'], 'claim'), 'papers': ('cache/papers_embeddings.tsv.bz2', ['url', 'title', 'popularity'], 'title')}
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+def normalize(vectors):
+	vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+	if vectors.ndim == 1:
+		vectors = vectors[None, :]
+	norm = np.linalg.norm(vectors, axis=1, keepdims=True)
+	return np.divide(vectors, norm, out=np.zeros_like(vectors), where=norm>0)
+
+#Rows of a matrix and a hash of their (text, url), next to the size/mtime stamp of its file
+def fingerprint(matrix_file, texts, urls):
+	h = hashlib.sha1()
+	for text, url in zip(texts, urls):
+		h.update((str(text) + '\t' + str(url) + '\n').encode('utf-8'))
+	return {'stamp': input_stamp(matrix_file), 'rows': len(texts), 'hash': h.hexdigest()}
+
+#Exact top-k by inner product of normalized vectors
+def brute_force(data, queries, k=K):
+	k = min(k, len(data))
+	scores = queries @ data.T
+	top_k = np.argpartition(-scores, k-1, axis=1)[:, :k]
+	top_k = np.take_along_axis(top_k, np.argsort(-np.take_along_axis(scores, top_k, axis=1), axis=1, kind='stable'), axis=1)
+	return top_k, np.take_along_axis(scores, top_k, axis=1)
+
+#Persisted HNSW index over cosine similarity; `items` holds the (text, url) of every label
+class ANNIndex:
+	def __init__(self, name, dim=None, index_dir=index_dir):
+		self.name = name
+		self.dim = dim
+		self.index_file = index_dir + name + '.hnsw'
+		self.items_file = index_dir + name + '_items.tsv.bz2'
+		self.index = None
+		self.items = pd.DataFrame(columns=['text', 'url'])
+		#fingerprint of the matrix the index was built from; row ids are only valid against that matrix
+		self.source = None
+
+	def __len__(self):
+		return len(self.items)
+
+	def exists(self):
+		return os.path.exists(self.index_file) and os.path.exists(self.items_file)
+
+	def build(self, vectors, items, ef_construction=EF_CONSTRUCTION, m=M):
+		vectors = normalize(vectors)
+		self.dim = vectors.shape[1]
+		self.index = hnswlib.Index(space='ip', dim=self.dim)
+		self.index.init_index(max_elements=max(len(vectors), 1), ef_construction=ef_construction, M=m)
+		self.index.set_ef(EF)
+		self.items = pd.DataFrame(columns=['text', 'url'])
+		self.add(vectors, items)
+		return self
+
+	#Incremental insert; the index grows as needed
+	def add(self, vectors, items):
+		vectors = normalize(vectors)
+		if not len(vectors):
+			return
+		if self.index is None:
+			return self.build(vectors, items)
+		if len(self.items) + len(vectors) > self.index.get_max_elements():
+			self.index.resize_index(max(2 * self.index.get_max_elements(), len(self.items) + len(vectors)))
+		labels = np.arange(len(self.items), len(self.items) + len(vectors))
+		self.index.add_items(vectors, labels)
+		self.items = pd.concat([self.items, pd.DataFrame(list(items), columns=['text', 'url'])], ignore_index=True)
+
+	#Batched k-NN: (labels, cosine similarities) per query
+	def knn(self, queries, k=K, ef=EF):
+		k = min(k, len(self.items))
+		self.index.set_ef(max(ef, k))
+		labels, distances = self.index.knn_query(normalize(queries), k=k)
+		return labels, 1 - distances
+
+	#Batched k-NN as lists of (text, url)
+	def query(self, queries, k=K, ef=EF):
+		if not len(self.items):
+			return [[] for _ in range(len(queries))]
+		labels, _ = self.knn(queries, k, ef)
+		items = list(self.items.itertuples(index=False, name=None))
+		return [[items[l] for l in row] for row in labels]
+
+	def vectors(self):
+		return np.array(self.index.get_items(np.arange(len(self.items))), dtype=np.float32)
+
+	def save(self):
+		os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+		self.index.save_index(self.index_file)
+		self.items.to_csv(self.items_file, sep='\t', index=False)
+		json.dump({'dim': self.dim, 'size': len(self), 'source': self.source}, open(self.index_file + '.json', 'w'))
+
+	def meta(self):
+		return json.load(open(self.index_file + '.json'))
+
+	def load(self, ef=EF):
+		self.items = pd.read_csv(self.items_file, sep='\t', keep_default_na=False)
+		meta = self.meta()
+		self.dim = self.dim or meta['dim']
+		self.source = meta.get('source')
+		self.index = hnswlib.Index(space='ip', dim=self.dim)
+		#leave room for incremental inserts
+		self.index.load_index(self.index_file, max_elements=max(2 * len(self.items), 1))
+		self.index.set_ef(ef)
+		return self
+
+############################### ######### ###############################
+
+#Build the claims and papers indexes from the embeddings of matrix_preparation
+@traced('ann/build')
+def build_indexes(names=MATRICES.keys()):
+	indexes = {}
+	for name in names:
+		matrix_file, index_col, text = MATRICES[name]
+		with span('ann/build:'+name, unit='vectors') as stage:
+			matrix = pd.read_csv(sciclops_dir + matrix_file, sep='\t', index_col=index_col)
+			stage.count(len(matrix))
+			texts, urls = matrix.index.get_level_values(text), matrix.index.get_level_values('url')
+			index = ANNIndex(name).build(matrix.values, zip(texts, urls))
+			index.source = fingerprint(matrix_file, texts, urls)
+			index.save()
+		indexes[name] = index
+	return indexes
+
+#Whether an index was built from the current matrix: same file stamp, or else the same rows
+def up_to_date(index, name):
+	matrix_file, index_col, text = MATRICES[name]
+	source = index.meta().get('source')
+	if not os.path.exists(sciclops_dir + matrix_file):
+		return True
+	if source is None:
+		return False
+	if source['stamp'] == input_stamp(matrix_file):
+		return True
+	items = pd.read_csv(sciclops_dir + matrix_file, sep='\t', usecols=[text, 'url'], dtype=str, keep_default_na=False)
+	return {k: v for k, v in fingerprint(matrix_file, items[text], items['url']).items() if k != 'stamp'} == {k: v for k, v in source.items() if k != 'stamp'}
+
+#The persisted index, rebuilt when it is missing or the matrices were prepared again since
+def load_index(name, ef=EF):
+	index = ANNIndex(name)
+	if not index.exists() or not up_to_date(index, name):
+		return build_indexes([name])[name]
+	return index.load(ef)
+
+#Add new claims, given as (claim, url) pairs, to the persisted claims index; they are cleaned and embedded
+#as in matrix_preparation, and claims that cleaning empties are skipped as they are there
+def add_claims(claims):
+	from clustering import clean_claim, embed_clean
+
+	index = load_index('claims')
+	cleaned = [(clean_claim(c), (c, u)) for c, u in claims]
+	cleaned = [(text, c) for text, c in cleaned if text]
+	if not cleaned:
+		return index
+	index.add(np.array([embed_clean(text) for text, _ in cleaned], dtype=np.float32), [c for _, c in cleaned])
+	index.save()
+	return index
+
+#Recall@k and latency of the index against exact search, for a sample of its own vectors as queries
+def benchmark(name, num_queries=1000, k=K, ef_values=[16, 32, 64, 128, 256], batch_size=100, seed=42):
+	index = load_index(name)
+	data = index.vectors()
+	queries = data[np.random.default_rng(seed).choice(len(data), min(num_queries, len(data)), replace=False)]
+
+	start = time.perf_counter()
+	latencies = []
+	for batch in range(0, len(queries), batch_size):
+		t = time.perf_counter()
+		exact, _ = brute_force(data, queries[batch:batch+batch_size], k)
+		latencies += [time.perf_counter() - t]
+	exact_seconds = time.perf_counter() - start
+	results = [{'method': 'brute_force', 'recall': 1.0, 'queries_per_second': len(queries) / exact_seconds, 'p50_ms': 1.e3 * np.percentile(latencies, 50), 'p99_ms': 1.e3 * np.percentile(latencies, 99)}]
+
+	exact = brute_force(data, queries, k)[0]
+	for ef in ef_values:
+		start = time.perf_counter()
+		latencies, approximate = [], []
+		for batch in range(0, len(queries), batch_size):
+			t = time.perf_counter()
+			approximate += [index.knn(queries[batch:batch+batch_size], k, ef)[0]]
+			latencies += [time.perf_counter() - t]
+		seconds = time.perf_counter() - start
+		approximate = np.concatenate(approximate)
+		recall = np.mean([len(set(a).intersection(e)) / len(e) for a, e in zip(approximate, exact)])
+		results += [{'method': 'hnsw', 'ef': ef, 'recall': recall, 'queries_per_second': len(queries) / seconds, 'p50_ms': 1.e3 * np.percentile(latencies, 50), 'p99_ms': 1.e3 * np.percentile(latencies, 99)}]
+
+	return {'index': name, 'size': len(data), 'dim': index.dim, 'k': k, 'queries': len(queries), 'batch_size': batch_size, 'results': results}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Build and benchmark the nearest-neighbour indexes over claims and papers.')
+	parser.add_argument('command', choices=['build', 'benchmark'])
+	parser.add_argument('--index', nargs='*', default=list(MATRICES.keys()), choices=list(MATRICES.keys()))
+	parser.add_argument('--k', type=int, default=K)
+	parser.add_argument('--queries', type=int, default=1000)
+	parser.add_argument('--output', default='ann_benchmark.json')
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		build_indexes(args.index)
+	else:
+		report = [benchmark(name, args.queries, args.k) for name in args.index]
+		for r in report:
+			for result in r['results']:
+				print('{:<8} {:<12} ef={:<5} recall@{}={:.3f} {:>10.0f} q/s p50={:.2f}ms p99={:.2f}ms'.format(r['index'], result['method'], result.get('ef', '-'), r['k'], result['recall'], result['queries_per_second'], result['p50_ms'], result['p99_ms']), file=sys.stderr)
+		json.dump(report, open(args.output, 'w'), indent=1)
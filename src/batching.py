@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+############################### CONSTANTS ###############################
+MAX_RELATED = 3
+#a batch is closed when it is full or its first request has waited this long
+BATCH_SIZE = 64
+BATCH_WAIT = 0.002 #seconds
+CACHE_SIZE = 10000
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+class LRUCache:
+	def __init__(self, size=CACHE_SIZE):
+		self.size = size
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = self.misses = 0
+
+	def get(self, key):
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return self.entries[key]
+			self.misses += 1
+			return None
+
+	def put(self, key, value):
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			if len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+
+############################### ######### ###############################
+
+#Collects concurrent requests into batches answered by a single worker thread, behind an LRU cache;
+#`index.context(claims, max_related)` answers a batch with one result per claim
+class Batcher:
+	def __init__(self, index, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT, cache_size=CACHE_SIZE):
+		self.index = index
+		self.batch_size = batch_size
+		self.batch_wait = batch_wait
+		self.cache = LRUCache(cache_size)
+		self.requests = queue.Queue()
+		#(claim, max_related) -> future of the request already queued for it
+		self.pending = {}
+		self.lock = threading.Lock()
+		self.batches = 0
+		threading.Thread(target=self.run, daemon=True).start()
+
+	def submit(self, claim, max_related=MAX_RELATED):
+		key = (claim, max_related)
+		with self.lock:
+			if key in self.pending:
+				return self.pending[key]
+			future = Future()
+			cached = self.cache.get(key)
+			if cached is not None:
+				future.set_result(cached)
+				return future
+			self.pending[key] = future
+		self.requests.put((claim, max_related, future))
+		return future
+
+	def context(self, claims, max_related=MAX_RELATED):
+		return [f.result() for f in [self.submit(c, max_related) for c in claims]]
+
+	#Results of a batch; when it fails, every claim is answered alone so a bad one fails only its own requests
+	def answer(self, claims, max_related):
+		try:
+			return self.index.context(claims, max_related)
+		except Exception:
+			results = []
+			for claim in claims:
+				try:
+					results += self.index.context([claim], max_related)
+				except Exception as e:
+					results += [e]
+			return results
+
+	def run(self):
+		while True:
+			batch = [self.requests.get()]
+			deadline = time.perf_counter() + self.batch_wait
+			while len(batch) < self.batch_size:
+				try:
+					batch += [self.requests.get(timeout=max(0, deadline - time.perf_counter()))]
+				except queue.Empty:
+					break
+			self.batches += 1
+
+			#one pass per max_related value in the batch
+			for max_related in set(r[1] for r in batch):
+				requests = [r for r in batch if r[1] == max_related]
+				for (claim, _, future), result in zip(requests, self.answer([r[0] for r in requests], max_related)):
+					if not isinstance(result, Exception):
+						self.cache.put((claim, max_related), result)
+					with self.lock:
+						del self.pending[(claim, max_related)]
+					if isinstance(result, Exception):
+						future.set_exception(result)
+					else:
+						future.set_result(result)
+
+	def stats(self):
+		return {'batches': self.batches, 'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses, 'cache_entries': len(self.cache.entries)}
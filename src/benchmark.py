@@ -0,0 +1,163 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from synthetic import generate, generated
+
+############################### CONSTANTS ###############################
+EDGES = 10000
+NUM_CLUSTERS = 10
+STANDALONE_METHODS = ['LDA', 'GSDMM', 'GMM', 'PCA-GMM', 'KMeans', 'PCA-KMeans']
+CLUSTERNET_TYPES = ['compute_C_transform_P', 'coordinate-align', 'compute-align-0.5']
+BASELINE_TYPES = ['pattern_only', 'lift_only']
+PRECISIONS = ['float64', 'float32', 'bfloat16']
+BASELINE_SENTENCES = 200
+REGRESSION_THRESHOLD = 1.2
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+def rss():
+	with open('/proc/self/statm') as f:
+		return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+#Samples the resident set size in the background and keeps the peak
+class MemorySampler(threading.Thread):
+	def __init__(self, interval=0.01):
+		super(MemorySampler, self).__init__(daemon=True)
+		self.interval = interval
+		self.start_rss = self.peak_rss = rss()
+		self.running = True
+
+	def run(self):
+		while self.running:
+			self.peak_rss = max(self.peak_rss, rss())
+			time.sleep(self.interval)
+
+	def stop(self):
+		self.running = False
+		self.join()
+		self.peak_rss = max(self.peak_rss, rss())
+
+#Run a stage and record its wall time, CPU time and memory; `items` maps the result to a count
+def measure(results, name, fn, items=None):
+	print(name + '...', file=sys.stderr)
+	sampler = MemorySampler()
+	sampler.start()
+	wall, cpu = time.perf_counter(), time.process_time()
+	result = fn()
+	wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+	sampler.stop()
+
+	record = {'stage': name, 'seconds': wall, 'cpu_seconds': cpu, 'peak_rss_mb': sampler.peak_rss / 2**20, 'delta_rss_mb': (sampler.peak_rss - sampler.start_rss) / 2**20}
+	if items is not None:
+		record['items'] = items(result)
+		record['items_per_second'] = record['items'] / wall if wall else None
+	results.append(record)
+	return result
+
+def selected(name, stages):
+	return not stages or any(name.startswith(s) for s in stages)
+
+############################### ######### ###############################
+
+def run(data_dir, edges=EDGES, stages=None, num_clusters=NUM_CLUSTERS):
+	results = []
+	if not generated(data_dir):
+		shutil.rmtree(data_dir, ignore_errors=True)
+		measure(results, 'generate', lambda: generate(data_dir, edges))
+
+	#the pipeline modules read their data directories at import time
+	os.environ['SCILENS_DIR'] = data_dir + '/scilens/'
+	os.environ['SCICLOPS_DIR'] = data_dir + '/sciclops/'
+
+	if any(selected(s, stages) for s in ['matrix_preparation', 'load_matrices', 'standalone_clustering', 'compute_clusterings', 'eval_clusters', 'enhance_context', 'precision']):
+		clustering = measure(results, 'import:clustering', lambda: importlib.import_module('clustering'))
+		clustering.NUM_CLUSTERS = num_clusters
+
+		if selected('matrix_preparation', stages):
+			measure(results, 'matrix_preparation', lambda: clustering.matrix_preparation(representations=['textual', 'embeddings'], pca_dimensions=[10]))
+		if selected('load_matrices', stages):
+			measure(results, 'load_matrices', lambda: clustering.load_matrices('embeddings'), items=lambda r: len(r[0]))
+
+		for method in STANDALONE_METHODS:
+			if selected('standalone_clustering:' + method, stages):
+				measure(results, 'standalone_clustering:' + method, lambda: clustering.standalone_clustering(method), items=lambda r: len(r[2]) + len(r[3]))
+
+		clusters = None
+		for clustering_type in CLUSTERNET_TYPES:
+			if selected('compute_clusterings:' + clustering_type, stages) or selected('eval_clusters:' + clustering_type, stages) or selected('enhance_context', stages):
+				clusters = measure(results, 'compute_clusterings:' + clustering_type, lambda: clustering.compute_clusterings(clustering_type, 'GMM'), items=lambda r: len(r[0]) + len(r[1]))
+				if selected('eval_clusters:' + clustering_type, stages):
+					measure(results, 'eval_clusters:' + clustering_type, lambda: clustering.eval_clusters(*clusters))
+
+		#the same preparation, clustering and evaluation in every precision: P@3/ASW should match while memory drops
+		for precision in PRECISIONS:
+			if selected('precision:' + precision, stages):
+				clustering.precision = precision
+				#the matrices are prepared again in this precision, so the run does not reuse the ones of another
+				measure(results, 'precision:' + precision + ':matrix_preparation', lambda: clustering.matrix_preparation(representations=['textual', 'embeddings'], pca_dimensions=[10]))
+				clusters_at = measure(results, 'precision:' + precision + ':compute_clusterings', lambda: clustering.compute_clusterings('compute-align-0.5', 'GMM'), items=lambda r: len(r[0]) + len(r[1]))
+				p, asw = measure(results, 'precision:' + precision + ':eval_clusters', lambda: clustering.eval_clusters(*clusters_at))
+				results[-2].update({'P@3': p, 'ASW': asw, 'clusters_mb': sum(c.memory_usage(index=False).sum() for c in clusters_at[:2]) / 2**20, 'cooc_mb': clusters_at[2].nbytes / 2**20})
+		clustering.precision = 'float32'
+
+		if selected('enhance_context', stages):
+			papers_clusters, claims_clusters, _ = clusters
+			papers_clusters.to_csv(os.environ['SCICLOPS_DIR'] + 'cache/papers_clusters.tsv.bz2', sep='\t')
+			claims_clusters.to_csv(os.environ['SCICLOPS_DIR'] + 'cache/claims_clusters.tsv.bz2', sep='\t')
+
+			contextualizing = measure(results, 'import:contextualizing', lambda: importlib.import_module('contextualizing'))
+			contextualizing.NUM_CLUSTERS = num_clusters
+			measure(results, 'enhance_context', contextualizing.enhance_context)
+
+	if any(selected('baseline:' + b, stages) for b in BASELINE_TYPES):
+		extracting = measure(results, 'import:extracting', lambda: importlib.import_module('extracting'))
+		sentences = pd.read_csv(os.environ['SCICLOPS_DIR'] + 'etc/arguments/UKP_IBM.tsv', sep='\t')['sentence'].head(BASELINE_SENTENCES).tolist()
+		for baseline_type in BASELINE_TYPES:
+			if selected('baseline:' + baseline_type, stages):
+				measure(results, 'baseline:' + baseline_type, lambda: [extracting.baseline(s, baseline_type) for s in sentences], items=len)
+
+	return {'edges': edges, 'num_clusters': num_clusters, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(), 'stages': results}
+
+#Stages that got slower than `threshold` times the previous run
+def compare(previous, current, threshold=REGRESSION_THRESHOLD):
+	before = {s['stage']: s for s in previous['stages']}
+	regressions = []
+	for s in current['stages']:
+		if s['stage'] in before:
+			ratio = s['seconds'] / max(before[s['stage']]['seconds'], 1.e-9)
+			memory = s['peak_rss_mb'] / max(before[s['stage']]['peak_rss_mb'], 1.e-9)
+			print('{:<45} {:>10.2f}s {:>8.2f}x time {:>8.2f}x memory'.format(s['stage'], s['seconds'], ratio, memory))
+			if ratio > threshold or memory > threshold:
+				regressions += [s['stage']]
+	return regressions
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark the SciClops pipeline on a synthetic corpus.')
+	parser.add_argument('--data-dir', default='/tmp/sciclops_benchmark')
+	parser.add_argument('--edges', type=int, default=EDGES)
+	parser.add_argument('--clusters', type=int, default=NUM_CLUSTERS)
+	parser.add_argument('--stages', nargs='*', help='stage name prefixes to run (default: all)')
+	parser.add_argument('--output', default='benchmark.json')
+	parser.add_argument('--compare', help='previous benchmark json to compare against')
+	args = parser.parse_args()
+
+	data_dir = args.data_dir + '/' + str(args.edges)
+	report = run(data_dir, args.edges, args.stages, args.clusters)
+	json.dump(report, open(args.output, 'w'), indent=1)
+
+	if args.compare:
+		regressions = compare(json.load(open(args.compare)), report)
+		if regressions:
+			print('regressions:', ', '.join(regressions))
+			sys.exit(1)
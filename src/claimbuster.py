@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+
+api_endpoint = os.getenv('CLAIMBUSTER_ENDPOINT', 'https://idir.uta.edu/claimbuster/api/v2/score/text/')
+cache_file = sciclops_dir + 'cache/claimbuster.db'
+
+CONCURRENCY = 8
+RATE_LIMIT = 10 #requests per second
+MAX_RETRIES = 5
+BACKOFF = 1.0 #seconds, doubled on every retry
+TIMEOUT = 30
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+#Token bucket shared by all worker threads; it holds at least one token, so that rates below 1/s still make progress
+class RateLimiter:
+	def __init__(self, rate):
+		self.rate = rate
+		self.capacity = max(1.0, rate)
+		self.tokens = self.capacity
+		self.last = time.monotonic()
+		self.lock = threading.Lock()
+
+	def wait(self):
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+				self.last = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				delay = (1 - self.tokens) / self.rate
+			time.sleep(delay)
+
+class ClaimBuster:
+	def __init__(self, endpoint=api_endpoint, api_key=None, cache_file=cache_file, concurrency=CONCURRENCY, rate_limit=RATE_LIMIT, max_retries=MAX_RETRIES, backoff=BACKOFF, timeout=TIMEOUT):
+		self.endpoint = endpoint
+		self.concurrency = concurrency
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.timeout = timeout
+		self.limiter = RateLimiter(rate_limit)
+
+		#one pooled session for all threads
+		self.session = requests.Session()
+		self.session.headers.update({'x-api-key': api_key or os.getenv('CLAIMBUSTER_KEY', '')})
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+
+		#persistent cache keyed by claim text; only touched from the calling thread
+		Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+		self.cache = sqlite3.connect(cache_file)
+		self.cache.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, claim TEXT, response TEXT)')
+
+	#responses of different endpoints (e.g. the stub) never mix in the cache
+	def key(self, claim):
+		return hashlib.sha1((self.endpoint + '\0' + claim).encode('utf-8')).hexdigest()
+
+	def cached(self, claim):
+		row = self.cache.execute('SELECT response FROM responses WHERE key = ?', (self.key(claim),)).fetchone()
+		return json.loads(row[0]) if row else None
+
+	def fetch(self, claim):
+		for attempt in range(self.max_retries + 1):
+			self.limiter.wait()
+			try:
+				response = self.session.post(url=self.endpoint, json={'input_text': claim}, timeout=self.timeout)
+				#a missing or wrong key fails every claim, so it stops the run
+				if response.status_code in [401, 403]:
+					response.raise_for_status()
+				#retry on throttling and server errors only; other client errors and non-JSON bodies score as None
+				if response.status_code != 429 and response.status_code < 500:
+					return response.json() if response.ok else None
+			except (requests.ConnectionError, requests.Timeout):
+				pass
+			except ValueError:
+				return None
+			if attempt < self.max_retries:
+				time.sleep(self.backoff * 2**attempt * (1 + random.random()))
+		return None
+
+	def score(self, claims):
+		results = {c: self.cached(c) for c in set(claims)}
+		missing = [c for c, r in results.items() if r is None]
+
+		with ThreadPoolExecutor(self.concurrency) as executor:
+			futures = {executor.submit(self.fetch, c): c for c in missing}
+			for future in as_completed(futures):
+				claim, response = futures[future], future.result()
+				results[claim] = response
+				if response is not None:
+					self.cache.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', (self.key(claim), claim, json.dumps(response)))
+					self.cache.commit()
+
+		return [results[c] for c in claims]
+
+	def close(self):
+		self.session.close()
+		self.cache.close()
+
+############################### ######### ###############################
+
+#Local stand-in for the ClaimBuster API; port 0 picks a free port
+def stub_server(port=8000, failure_rate=0.0):
+	class Handler(BaseHTTPRequestHandler):
+		def do_POST(self):
+			claim = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['input_text']
+			if random.random() < failure_rate:
+				self.send_response(503)
+				self.end_headers()
+				return
+			score = int(hashlib.sha1(claim.encode('utf-8')).hexdigest(), 16) % 1000 / 1000
+			body = json.dumps({'version': 'stub', 'claim': claim, 'results': [{'text': claim, 'index': 0, 'score': score}]}).encode('utf-8')
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, *args):
+			pass
+
+	return ThreadingHTTPServer(('localhost', port), Handler)
+
+def serve_stub(port=8000, failure_rate=0.0):
+	stub_server(port, failure_rate).serve_forever()
+
+
+if __name__ == "__main__":
+	serve_stub()
@@ -0,0 +1,188 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import requests
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+
+claimskg_endpoint = 'https://data.gesis.org/claimskg/sparql'
+store_file = sciclops_dir + 'cache/claimskg.db'
+
+PAGE_SIZE = 10000
+WORKERS = 4
+TIMEOUT = 120
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+def ClaimsKG_query(offset=None, limit=None, since=None):
+#Query for https://data.gesis.org/claimskg/sparql; `since` keeps the claims reviewed on or after an ISO date
+
+	query = '''
+	PREFIX schema:<http://schema.org/>
+	PREFIX nif:<http://persistence.uni-leipzig.org/nlp2rdf/ontologies/nif-core#>
+	PREFIX :<http://data.gesis.org/claimskg/organization/>
+
+	SELECT ?claim ?claimText ?claimKeywords ?rating
+	(GROUP_CONCAT(DISTINCT ?claimEntity;separator=",") as ?claimEntities)
+	(MAX(?date) as ?reviewDate)
+
+	WHERE {
+	?claim a schema:CreativeWork.
+	?claim schema:text ?claimText.
+	?claim schema:keywords ?claimKeywords.
+	?claim schema:mentions/nif:isString ?claimEntity.
+
+	?claimReview schema:itemReviewed ?claim.
+	?claimReview schema:reviewRating ?reviewRating.
+	?reviewRating schema:author :claimskg.
+	?reviewRating schema:alternateName ?rating.
+	OPTIONAL { ?claimReview schema:datePublished ?date. }
+
+	FILTER( ?rating = "FALSE"@en || ?rating = "TRUE"@en)
+	%s
+	} GROUP BY ?claim ?claimText ?claimKeywords ?rating
+	ORDER BY ?claim ?rating
+	%s
+	''' % ('FILTER( BOUND(?date) && STR(?date) >= "%s")' % since if since else '', 'offset %d limit %d' % (offset, limit) if limit else '')
+	return query
+
+#Rows of a SPARQL JSON result as dicts of plain strings
+def sparql_rows(result):
+	return [{k: v['value'] for k, v in b.items()} for b in result['results']['bindings']]
+
+#Fetch one page from a SPARQL endpoint
+def fetch_endpoint_page(endpoint, offset, limit, since=None, session=requests):
+	response = session.get(endpoint, params={'query': ClaimsKG_query(offset, limit, since), 'format': 'json'}, headers={'Accept': 'application/sparql-results+json'}, timeout=TIMEOUT)
+	response.raise_for_status()
+	return sparql_rows(response.json())
+
+#Page through a SPARQL endpoint, fetching `workers` pages at a time, until a short page is returned
+def endpoint_pages(endpoint, page_size=PAGE_SIZE, workers=WORKERS, since=None):
+	session = requests.Session()
+	offset = 0
+	with ThreadPoolExecutor(workers) as executor:
+		while True:
+			offsets = [offset + i * page_size for i in range(workers)]
+			pages = list(executor.map(lambda o: fetch_endpoint_page(endpoint, o, page_size, since, session), offsets))
+			for rows in pages:
+				yield rows
+				if len(rows) < page_size:
+					return
+			offset = offsets[-1] + page_size
+
+#A local RDF/N-Triples dump, queried once with the same query and read in pages
+def dump_pages(dump_file, page_size=PAGE_SIZE, since=None):
+	import rdflib
+
+	graph = rdflib.Graph()
+	graph.parse(dump_file)
+	results = iter(graph.query(ClaimsKG_query(since=since)))
+	while True:
+		rows = [{str(k): str(v) for k, v in r.asdict().items() if v is not None} for r in itertools.islice(results, page_size)]
+		yield rows
+		if len(rows) < page_size:
+			return
+
+#A pre-exported csv (e.g. etc/claimKG/claims.csv) as a single page
+def csv_pages(csv_file):
+	df = pd.read_csv(csv_file, dtype=str).fillna('')
+	yield df.to_dict('records')
+
+############################### ######### ###############################
+
+class ClaimsKG:
+	def __init__(self, store_file=store_file):
+		Path(store_file).parent.mkdir(parents=True, exist_ok=True)
+		self.db = sqlite3.connect(store_file)
+		self.db.executescript('''
+			CREATE TABLE IF NOT EXISTS claims (id INTEGER PRIMARY KEY, key TEXT UNIQUE, text TEXT, keywords TEXT, rating TEXT);
+			CREATE TABLE IF NOT EXISTS entities (claim_id INTEGER, entity TEXT, UNIQUE(claim_id, entity));
+			CREATE INDEX IF NOT EXISTS entities_entity ON entities (entity);
+			CREATE INDEX IF NOT EXISTS claims_rating ON claims (rating);
+			CREATE VIRTUAL TABLE IF NOT EXISTS claims_fts USING fts5(text, content='claims', content_rowid='id');
+			CREATE TABLE IF NOT EXISTS refreshes (source TEXT PRIMARY KEY, last_date TEXT);
+		''')
+
+	def __len__(self):
+		return self.db.execute('SELECT COUNT(*) FROM claims').fetchone()[0]
+
+	#Insert new claims and update the text, keywords, rating and entities of known ones; returns the number of claims changed
+	def insert(self, rows):
+		changed = 0
+		for r in rows:
+			text, keywords, rating = r['claimText'], r.get('claimKeywords', ''), r['rating']
+			entities = sorted(set(e for e in r.get('claimEntities', '').split(',') if e))
+			#claims are identified by their IRI, or by their text in exports without one
+			key = r.get('claim') or hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+			row = self.db.execute('SELECT id, text, keywords, rating FROM claims WHERE key = ?', (key,)).fetchone()
+			if row is None:
+				claim_id = self.db.execute('INSERT INTO claims (key, text, keywords, rating) VALUES (?, ?, ?, ?)', (key, text, keywords, rating)).lastrowid
+			else:
+				claim_id = row[0]
+				if row[1:] == (text, keywords, rating) and self.entities(claim_id) == entities:
+					continue
+				self.db.execute('UPDATE claims SET text = ?, keywords = ?, rating = ? WHERE id = ?', (text, keywords, rating, claim_id))
+				self.db.execute("INSERT INTO claims_fts (claims_fts, rowid, text) VALUES ('delete', ?, ?)", (claim_id, row[1]))
+				self.db.execute('DELETE FROM entities WHERE claim_id = ?', (claim_id,))
+			self.db.execute('INSERT INTO claims_fts (rowid, text) VALUES (?, ?)', (claim_id, text))
+			self.db.executemany('INSERT INTO entities VALUES (?, ?)', [(claim_id, e) for e in entities])
+			changed += 1
+		return changed
+
+	def entities(self, claim_id):
+		return [e for e, in self.db.execute('SELECT entity FROM entities WHERE claim_id = ? ORDER BY entity', (claim_id,))]
+
+	#Ingest from an endpoint URL, an RDF dump or a csv export. A refresh only asks for the claims reviewed since the
+	#latest review date of the last complete refresh (that day included), unless full=True
+	def ingest(self, source=claimskg_endpoint, page_size=PAGE_SIZE, workers=WORKERS, full=False):
+		row = self.db.execute('SELECT last_date FROM refreshes WHERE source = ?', (source,)).fetchone()
+		since = None if (full or not row) else row[0]
+
+		if source.startswith('http'):
+			pages = endpoint_pages(source, page_size, workers, since)
+		elif source.endswith('.csv'):
+			pages = csv_pages(source)
+		else:
+			pages = dump_pages(source, page_size, since)
+
+		changed, last_date = 0, since or ''
+		for rows in pages:
+			changed += self.insert(rows)
+			last_date = max([last_date] + [r.get('reviewDate') or '' for r in rows])
+			self.db.commit()
+
+		if last_date:
+			self.db.execute('INSERT OR REPLACE INTO refreshes VALUES (?, ?)', (source, last_date))
+			self.db.commit()
+		return changed
+
+	#Claims mentioning any (or all) of the given terms
+	def search(self, terms, operator='OR', columns=('text', 'rating')):
+		query = (' ' + operator + ' ').join('"' + t.replace('"', '""') + '"' for t in terms)
+		return self.db.execute('SELECT ' + ', '.join('claims.' + c for c in columns) + ' FROM claims_fts JOIN claims ON claims.id = claims_fts.rowid WHERE claims_fts MATCH ? ORDER BY claims.id', (query,)).fetchall()
+
+	def entity(self, entity, columns=('text', 'rating')):
+		return self.db.execute('SELECT ' + ', '.join('claims.' + c for c in columns) + ' FROM entities JOIN claims ON claims.id = entities.claim_id WHERE entities.entity = ? ORDER BY claims.id', (entity,)).fetchall()
+
+	def close(self):
+		self.db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+if __name__ == "__main__":
+	store = ClaimsKG()
+	print(store.ingest(), 'new or changed claims,', len(store), 'in total')
+	store.close()
@@ -1,7 +1,8 @@
 from collections import Counter
+import json
+import os
 from pathlib import Path
 
-import networkx as nx
 import numpy as np
 import pandas as pd
 import spacy
@@ -9,6 +10,7 @@ import torch
 import torch.nn as nn
 from gsdmm import MovieGroupProcess
 from pandarallel import pandarallel
+from scipy import sparse
 from sklearn.cluster import KMeans
 from sklearn.decomposition import LatentDirichletAllocation, TruncatedSVD
 from sklearn.feature_extraction.text import CountVectorizer
@@ -17,12 +19,20 @@ from sklearn.preprocessing import MultiLabelBinarizer
 from spacy.lang.en.stop_words import STOP_WORDS
 from torch import optim
 
+from dedup import collapse, contract, expand
+from instrumentation import span, traced
+from sources import SCHEMAS, input_stamp, read_graph, read_source
+
 ############################### CONSTANTS ###############################
-scilens_dir = str(Path.home()) + '/data/scilens/cache/diffusion_graph/scilens_3M/'
-sciclops_dir = str(Path.home()) + '/data/sciclops/'
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
 hn_vocabulary = set(map(str.lower, open(sciclops_dir + 'etc/hn_vocabulary/hn_vocabulary.txt').read().splitlines()))
+#inputs and parameters of the cached matrices
+matrices_file = sciclops_dir + 'cache/matrices.json'
+MATRIX_INPUTS = ['cache/claims_raw.tsv.bz2', 'small_files/blacklist/sources.txt', 'etc/hn_vocabulary/hn_vocabulary.txt'] + [SCHEMAS[s]['file'] for s in ['graph', 'papers', 'tweets']]
 
 CLAIM_THRESHOLD = 10
+#estimated Jaccard similarity above which claims are collapsed (None keeps every claim)
+DEDUP_THRESHOLD = 0.8
 nlp = spacy.load('en_core_web_lg')
 for word in STOP_WORDS:
     for w in (word, word[0].capitalize(), word.upper()):
@@ -39,12 +49,29 @@ hidden = 50
 batch_size = 128
 beta = 1.e-3
 gamma = 1.e-3
+#float64, float32, or bfloat16 (float32 storage, bfloat16 autocast during training)
+precision = 'float32'
 ############################### ######### ###############################
 
 ################################ HELPERS ################################
-#Read diffusion graph
-def read_graph(graph_file):
-	return nx.from_pandas_edgelist(pd.read_csv(graph_file, sep='\t', header=None), 0, 1, create_using=nx.DiGraph())
+def float_dtype():
+	return np.float64 if precision == 'float64' else np.float32
+
+def torch_dtype():
+	return torch.float64 if precision == 'float64' else torch.float32
+
+def tensor(x):
+	return torch.as_tensor(np.asarray(x, dtype=float_dtype()))
+
+#What the cached matrices are prepared from: the stamps of their inputs and the parameters
+def matrices_stamp(representations, pca_dimensions, dedup_threshold):
+	return {'inputs': {p: input_stamp(p) for p in MATRIX_INPUTS}, 'representations': representations, 'pca_dimensions': pca_dimensions, 'dedup_threshold': dedup_threshold, 'dtype': float_dtype().__name__}
+
+#Read a cached matrix, parsing its value columns straight into `dtype`
+def read_matrix(matrix_file, index_col, dtype=None):
+	if dtype is not None:
+		dtype = {c: dtype for c in pd.read_csv(matrix_file, sep='\t', nrows=0).columns if c not in index_col}
+	return pd.read_csv(matrix_file, sep='\t', index_col=index_col, dtype=dtype)
 
 #Remove stopwords/Lemmatize
 def clean_claim(text):
@@ -66,109 +93,157 @@ def clean_paper(text):
 	text = [w for w in hn_vocabulary if w in text]
 	return text
 
-def matrix_preparation(representations, pca_dimensions=None):
+#Vector of a cleaned claim or paper, as in the embeddings matrices
+def embed_clean(text):
+	return nlp(' '.join(text)).vector
+
+@traced('matrix_preparation')
+def matrix_preparation(representations, pca_dimensions=None, dedup_threshold=DEDUP_THRESHOLD):
 	pandarallel.initialize(verbose=0)
+	stamp = matrices_stamp(representations, pca_dimensions, dedup_threshold)
 	
-	claims = pd.read_csv(sciclops_dir+'cache/claims_raw.tsv.bz2', sep='\t')
+	with span('matrix_preparation/loading'):
+		claims = pd.read_csv(sciclops_dir+'cache/claims_raw.tsv.bz2', sep='\t')
 
-	G = read_graph(scilens_dir + 'diffusion_graph_v7.tsv.bz2')
-	G.remove_nodes_from(open(sciclops_dir + 'small_files/blacklist/sources.txt').read().splitlines())
+		G = read_graph()
+		G.remove_nodes_from(open(sciclops_dir + 'small_files/blacklist/sources.txt').read().splitlines())
 	
-	papers = pd.read_csv(scilens_dir + 'paper_details_v1.tsv.bz2', sep='\t').drop_duplicates(subset='url')
-
-	print('cleaning papers...')
-	#papers['clean_passage'] = papers.title + ' ' + papers.full_text.parallel_apply(lambda w: w.split('\n')[0])
-	#papers['clean_passage'] = clean_paper(papers['clean_passage'])
-	papers['clean_passage'] = papers.title.parallel_apply(clean_paper)
-	papers = papers[papers['clean_passage'].str.len() != 0]
-	papers['popularity'] = papers.url.parallel_apply(lambda u: G.in_degree(u))
-	refs = set(papers['url'].unique())
-
-	print('cleaning claims...')	
-	claims['refs'] = claims.url.parallel_apply(lambda u: set(G.successors(u)).intersection(refs))
-	claims = claims[claims['refs'].str.len() != 0]
-
-	tweets = pd.read_csv(scilens_dir + 'tweet_details_v1.tsv.bz2', sep='\t').drop_duplicates(subset='url').set_index('url')
-	claims['popularity'] = claims.url.parallel_apply(lambda u: sum([tweets.loc[t]['popularity'] for t in G.predecessors(u) if t in tweets.index]))
-
-	claims.claim = claims.claim.apply(eval)
-	claims = claims.explode('claim')
-
-	claims['clean_claim'] = claims['claim'].parallel_apply(clean_claim)
-	claims = claims[claims['clean_claim'].str.len() != 0]
-	refs = set([e for l in claims['refs'].to_list() for e in l])
-	papers = papers[papers['url'].isin(refs)]
+		papers = read_source('papers', ['url', 'title'], unique='url')
+
+	with span('matrix_preparation/cleaning_papers', items=len(papers), unit='docs'):
+		#papers['clean_passage'] = papers.title + ' ' + papers.full_text.parallel_apply(lambda w: w.split('\n')[0])
+		#papers['clean_passage'] = clean_paper(papers['clean_passage'])
+		papers['clean_passage'] = papers.title.parallel_apply(clean_paper)
+		papers = papers[papers['clean_passage'].str.len() != 0]
+		papers['popularity'] = papers.url.parallel_apply(lambda u: G.in_degree(u))
+		refs = set(papers['url'].unique())
+
+	with span('matrix_preparation/cleaning_claims', unit='claims') as stage:
+		claims['refs'] = claims.url.parallel_apply(lambda u: set(G.successors(u)).intersection(refs))
+		claims = claims[claims['refs'].str.len() != 0]
+
+		tweets = read_source('tweets', ['url', 'popularity'], unique='url').set_index('url')
+		claims['popularity'] = claims.url.parallel_apply(lambda u: sum([tweets.loc[t]['popularity'] for t in G.predecessors(u) if t in tweets.index]))
+
+		claims.claim = claims.claim.apply(eval)
+		claims = claims.explode('claim')
+
+		claims['clean_claim'] = claims['claim'].parallel_apply(clean_claim)
+		claims = claims[claims['clean_claim'].str.len() != 0]
+		stage.count(len(claims))
+		refs = set([e for l in claims['refs'].to_list() for e in l])
+		papers = papers[papers['url'].isin(refs)]
+
+	#syndicated near-duplicates become one canonical claim; the mapping expands the clusters back
+	with span('matrix_preparation/dedup', items=len(claims), unit='claims') as stage:
+		claims, mapping = collapse(claims, dedup_threshold)
+		mapping.to_csv(sciclops_dir + 'cache/claims_dedup.tsv.bz2', sep='\t', index=False)
+		stage.attributes['canonical_claims'] = len(claims)
 
 	papers = papers.set_index(['url', 'title', 'popularity'])
 	claims = claims.set_index(['url', 'claim', 'popularity'])
 	papers_index = papers.index
 	claims_index = claims.index
 
-	mlb = MultiLabelBinarizer()
-	cooc = pd.DataFrame(mlb.fit_transform(claims.refs), columns=mlb.classes_, index=claims.index)
-	cooc.to_csv(sciclops_dir + 'cache/cooc.tsv.bz2', sep='\t')
+	with span('matrix_preparation/cooc', items=len(claims), unit='claims'):
+		#binary pattern, kept sparse in uint8; rows follow the claims matrices, columns are the paper urls
+		mlb = MultiLabelBinarizer(sparse_output=True)
+		sparse.save_npz(sciclops_dir + 'cache/cooc.npz', mlb.fit_transform(claims.refs).astype(np.uint8).tocsr())
+		open(sciclops_dir + 'cache/cooc_papers.txt', 'w').write('\n'.join(mlb.classes_))
 
 	for representation in representations:
-		print('transforming...')
-		if representation =='textual':
-			papers_vec = papers['clean_passage'].parallel_apply(lambda x: ' '.join(x))
-			claims_vec = claims['clean_claim'].parallel_apply(lambda x: ' '.join(x))
+		with span('matrix_preparation/transforming:'+representation, items=len(papers)+len(claims), unit='docs'):
+			if representation =='textual':
+				papers_vec = papers['clean_passage'].parallel_apply(lambda x: ' '.join(x))
+				claims_vec = claims['clean_claim'].parallel_apply(lambda x: ' '.join(x))
+
+			elif representation =='embeddings':
+				papers_vec = np.stack(papers['clean_passage'].parallel_apply(embed_clean).values).astype(float_dtype())
+				claims_vec = np.stack(claims['clean_claim'].parallel_apply(embed_clean).values).astype(float_dtype())
 
-		elif representation =='embeddings':
-			papers_vec = papers['clean_passage'].parallel_apply(lambda x: nlp(' '.join(x)).vector).apply(pd.Series).values
-			claims_vec = claims['clean_claim'].parallel_apply(lambda x: nlp(' '.join(x)).vector).apply(pd.Series).values
+		with span('matrix_preparation/caching:'+representation):
+			if representation == 'embeddings' and pca_dimensions != None:
+				for dimension in pca_dimensions:
+					pca = TruncatedSVD(dimension).fit(claims_vec).fit(papers_vec)
+					pd.DataFrame(pca.transform(papers_vec).astype(float_dtype()), index=papers_index).to_csv(sciclops_dir + 'cache/papers_'+representation+'_'+str(dimension)+'.tsv.bz2', sep='\t')
+					pd.DataFrame(pca.transform(claims_vec).astype(float_dtype()), index=claims_index).to_csv(sciclops_dir + 'cache/claims_'+representation+'_'+str(dimension)+'.tsv.bz2', sep='\t')	
 
-		print('caching...')
-		if representation == 'embeddings' and pca_dimensions != None:
-			for dimension in pca_dimensions:
-				pca = TruncatedSVD(dimension).fit(claims_vec).fit(papers_vec)
-				pd.DataFrame(pca.transform(papers_vec), index=papers_index).to_csv(sciclops_dir + 'cache/papers_'+representation+'_'+str(dimension)+'.tsv.bz2', sep='\t')
-				pd.DataFrame(pca.transform(claims_vec), index=claims_index).to_csv(sciclops_dir + 'cache/claims_'+representation+'_'+str(dimension)+'.tsv.bz2', sep='\t')	
+			pd.DataFrame(papers_vec, index=papers_index).to_csv(sciclops_dir + 'cache/papers_'+representation+'.tsv.bz2', sep='\t')
+			pd.DataFrame(claims_vec, index=claims_index).to_csv(sciclops_dir + 'cache/claims_'+representation+'.tsv.bz2', sep='\t')	
 
-		pd.DataFrame(papers_vec, index=papers_index).to_csv(sciclops_dir + 'cache/papers_'+representation+'.tsv.bz2', sep='\t')
-		pd.DataFrame(claims_vec, index=claims_index).to_csv(sciclops_dir + 'cache/claims_'+representation+'.tsv.bz2', sep='\t')	
+	json.dump(stamp, open(matrices_file, 'w'))
 
+@traced('load_matrices')
 def load_matrices(representation, dimension=None):
-	matrix_preparation(representations=['textual','embeddings'], pca_dimensions=[10])
-	cooc = pd.read_csv(sciclops_dir + 'cache/cooc.tsv.bz2', sep='\t', index_col=['url', 'claim', 'popularity'])
-	claims = pd.read_csv(sciclops_dir + 'cache/claims_'+representation+('_'+str(dimension) if dimension else '')+'.tsv.bz2', sep='\t', index_col=['url', 'claim', 'popularity'])
-	papers = pd.read_csv(sciclops_dir + 'cache/papers_'+representation+('_'+str(dimension) if dimension else '')+'.tsv.bz2', sep='\t', index_col=['url', 'title', 'popularity'])
+	#prepare the matrices if they are missing, or were prepared from other inputs, dedup threshold or precision
+	stamp = json.load(open(matrices_file)) if os.path.exists(matrices_file) else None
+	prepared = stamp is not None and stamp == matrices_stamp(stamp['representations'], stamp['pca_dimensions'], DEDUP_THRESHOLD) and representation in stamp['representations'] and dimension in [None] + (stamp['pca_dimensions'] or [])
+	if not prepared or not os.path.exists(sciclops_dir + 'cache/cooc.npz') or not os.path.exists(sciclops_dir + 'cache/claims_'+representation+('_'+str(dimension) if dimension else '')+'.tsv.bz2'):
+		matrix_preparation(representations=['textual','embeddings'], pca_dimensions=[10])
+	dtype = float_dtype() if representation == 'embeddings' else None
+	claims = read_matrix(sciclops_dir + 'cache/claims_'+representation+('_'+str(dimension) if dimension else '')+'.tsv.bz2', ['url', 'claim', 'popularity'], dtype)
+	cooc = pd.DataFrame.sparse.from_spmatrix(sparse.load_npz(sciclops_dir + 'cache/cooc.npz'), index=claims.index, columns=open(sciclops_dir + 'cache/cooc_papers.txt').read().splitlines())
+	papers = read_matrix(sciclops_dir + 'cache/papers_'+representation+('_'+str(dimension) if dimension else '')+'.tsv.bz2', ['url', 'title', 'popularity'], dtype)
 	return cooc, papers, claims
 
-def popular_clusters():
-  NUM_CLUSTERS = 100 
-  claims_clusters = pd.read_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
-  papers_clusters = pd.read_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t')
-  
-  claims_popularity = claims_clusters['popularity']
-  papers_popularity = papers_clusters['popularity']
-  
-  claims_rank = [sum(claims_clusters[str(i)]*claims_popularity) for i in range(NUM_CLUSTERS)]
-  claims_rank = [r/sum(claims_rank) for r in claims_rank]
-  papers_rank = [sum(papers_clusters[str(i)]*papers_popularity) for i in range(NUM_CLUSTERS)]
-  papers_rank = [r/sum(papers_rank) for r in papers_rank]
-
-  rank = np.flip(np.argsort(np.array(claims_rank) + np.array(papers_rank)))
-
-  for c in range(NUM_CLUSTERS):
-    print('cluster: ', c)
-    claims_centroid = claims_clusters.iloc[claims_clusters[str(c)].argmax()]['claim'].lower()
-    print(claims_centroid)
-    claims_centroid = set(claims_centroid.split()).intersection(hn_vocabulary)
-    
-    papers_centroid = papers_clusters.iloc[papers_clusters[str(c)].argmax()]['title'].lower()
-    print(papers_centroid)
-    papers_centroid = set(papers_centroid.split()).intersection(hn_vocabulary)
-
-    print(claims_centroid.union(papers_centroid))
+#Popularity-weighted mass, top-N representatives and vocabulary centroid of every cluster
+def summarize_clusters(df, text, num_clusters, top_n=3, top_terms=10):
+	X = df[[str(i) for i in range(num_clusters)]].values
+	top_n = min(top_n, len(X))
+
+	mass = X.T @ df['popularity'].values
+	mass = mass / mass.sum()
+
+	top = np.argpartition(-X, top_n-1, axis=0)[:top_n]
+	top = np.take_along_axis(top, np.argsort(-np.take_along_axis(X, top, axis=0), axis=0), axis=0)
+
+	CV = CountVectorizer(vocabulary=sorted(hn_vocabulary), tokenizer=str.split, token_pattern=None, binary=True)
+	centroids = np.asarray((CV.transform(df[text].str.lower()).T @ X).T)
+	vocabulary = CV.get_feature_names_out()
+
+	top_terms = min(top_terms, centroids.shape[1])
+	terms = np.argpartition(-centroids, top_terms-1, axis=1)[:, :top_terms]
+	terms = np.take_along_axis(terms, np.argsort(-np.take_along_axis(centroids, terms, axis=1), axis=1), axis=1)
+
+	texts = df[text].values
+	return mass, [list(texts[top[:, c]]) for c in range(num_clusters)], [[vocabulary[t] for t in terms[c] if centroids[c, t] > 0] for c in range(num_clusters)]
+
+@traced('popular_clusters')
+def popular_clusters(num_clusters=100, top_n=3, report_file=sciclops_dir + 'cache/clusters_report.json'):
+	claims_clusters = pd.read_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
+	papers_clusters = pd.read_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t')
+	#representatives are picked among canonical claims, not among the copies of a syndicated one
+	if os.path.exists(sciclops_dir + 'cache/claims_dedup.tsv.bz2'):
+		claims_clusters = contract(claims_clusters, pd.read_csv(sciclops_dir + 'cache/claims_dedup.tsv.bz2', sep='\t'))
+
+	claims_rank, top_claims, claims_terms = summarize_clusters(claims_clusters, 'claim', num_clusters, top_n)
+	papers_rank, top_papers, papers_terms = summarize_clusters(papers_clusters, 'title', num_clusters, top_n)
+
+	report = pd.DataFrame({
+		'cluster': range(num_clusters),
+		'claims_rank': claims_rank,
+		'papers_rank': papers_rank,
+		'top_claims': top_claims,
+		'top_papers': top_papers,
+		'terms': [list(dict.fromkeys(c + p)) for c, p in zip(claims_terms, papers_terms)],
+	})
+	report['rank'] = report['claims_rank'] + report['papers_rank']
+	report = report.sort_values('rank', ascending=False, kind='stable').reset_index(drop=True)
+
+	if report_file.endswith('.parquet'):
+		report.to_parquet(report_file, index=False)
+	else:
+		report.to_json(report_file, orient='records', indent=1)
+	return report
 
+@traced('standalone_clustering')
 def standalone_clustering(method):
 	dimension = 10 if method.startswith('PCA') else None
 
 	if method.endswith('GMM'):
 		cooc, papers, claims = load_matrices(representation='embeddings', dimension=dimension)
 
-		cooc = cooc.values
+		cooc = cooc.sparse.to_dense().values
 		papers_index = papers.index
 		claims_index = claims.index
 		papers = papers.values
@@ -181,7 +256,7 @@ def standalone_clustering(method):
 	elif method.endswith('KMeans'):
 		cooc, papers, claims = load_matrices(representation='embeddings', dimension=dimension)
 
-		cooc = cooc.values
+		cooc = cooc.sparse.to_dense().values
 		papers_index = papers.index
 		claims_index = claims.index		
 		papers = papers.values
@@ -191,14 +266,14 @@ def standalone_clustering(method):
 		c_cluster = model.predict(claims)
 		p_cluster = model.predict(papers)
 
-		claims_clusters = np.zeros((len(claims), NUM_CLUSTERS))
+		claims_clusters = np.zeros((len(claims), NUM_CLUSTERS), dtype=float_dtype())
 		claims_clusters[np.arange(len(claims)), c_cluster] = 1
-		papers_clusters = np.zeros((len(papers), NUM_CLUSTERS))
+		papers_clusters = np.zeros((len(papers), NUM_CLUSTERS), dtype=float_dtype())
 		papers_clusters[np.arange(len(papers)), p_cluster] = 1
 
 	elif method == 'LDA':
 		cooc, papers, claims = load_matrices(representation='textual')
-		cooc = cooc.values
+		cooc = cooc.sparse.to_dense().values
 		papers_index = papers.index
 		claims_index = claims.index
 		papers = papers['clean_passage']
@@ -212,20 +287,20 @@ def standalone_clustering(method):
 
 	elif method == 'GSDMM':
 		cooc, papers, claims = load_matrices(representation='textual')
-		cooc = cooc.values
+		cooc = cooc.sparse.to_dense().values
 		papers_index = papers.index
 		claims_index = claims.index
 		
 		c_cluster = MovieGroupProcess(K=NUM_CLUSTERS, n_iters=5).fit(claims['clean_claim'], len(set([e for l in claims['clean_claim'].tolist() for e in l])))
 		p_cluster = MovieGroupProcess(K=NUM_CLUSTERS, n_iters=5).fit(papers['clean_passage'], len(set([e for l in papers['clean_passage'].tolist() for e in l])))
 		
-		claims_clusters = np.zeros((len(claims), NUM_CLUSTERS))
+		claims_clusters = np.zeros((len(claims), NUM_CLUSTERS), dtype=float_dtype())
 		claims_clusters[np.arange(len(claims)), c_cluster] = 1
-		papers_clusters = np.zeros((len(papers), NUM_CLUSTERS))
+		papers_clusters = np.zeros((len(papers), NUM_CLUSTERS), dtype=float_dtype())
 		papers_clusters[np.arange(len(papers)), p_cluster] = 1
 
-	papers_clusters = pd.DataFrame(papers_clusters, index=papers_index)
-	claims_clusters = pd.DataFrame(claims_clusters, index=claims_index)
+	papers_clusters = pd.DataFrame(papers_clusters.astype(float_dtype(), copy=False), index=papers_index)
+	claims_clusters = pd.DataFrame(claims_clusters.astype(float_dtype(), copy=False), index=claims_index)
 
 	return papers, claims, papers_clusters, claims_clusters, cooc
 
@@ -244,9 +319,9 @@ class ClusterNet(nn.Module):
 			self.cooc_unique, index = np.unique(self.cooc, axis=0, return_index=True)
 			self.claims_unique = self.claims_clusters[index]
 
-			self.cooc_unique = torch.Tensor(self.cooc_unique.astype(float))
-			self.papers = torch.Tensor(self.papers.astype(float))
-			self.claims_unique = torch.Tensor(self.claims_unique.astype(float))
+			self.cooc_unique = torch.as_tensor(self.cooc_unique)
+			self.papers = tensor(self.papers)
+			self.claims_unique = tensor(self.claims_unique)
 
 			if 'transform_P' in self.clustering_type:
 				self.papersNet = nn.Sequential(
@@ -257,7 +332,7 @@ class ClusterNet(nn.Module):
 					nn.Softmax(dim=1)
 				)
 			elif 'align_P' in self.clustering_type:
-				self.papers_clusters = nn.Parameter(nn.init.eye_(torch.Tensor(self.papers.shape[0], NUM_CLUSTERS)), requires_grad=True)
+				self.papers_clusters = nn.Parameter(nn.init.eye_(torch.empty(self.papers.shape[0], NUM_CLUSTERS, dtype=torch_dtype())), requires_grad=True)
 
 		elif 'compute_P' in self.clustering_type:
 			_, self.claims, papers_clusters, claims_clusters, self.cooc = standalone_clustering(method=init_clustering_method)
@@ -268,9 +343,9 @@ class ClusterNet(nn.Module):
 			self.cooc_unique, index = np.unique(self.cooc, axis=1, return_index=True)
 			self.papers_unique = self.papers_clusters[index]
 
-			self.cooc_unique = torch.Tensor(self.cooc_unique.astype(float))
-			self.claims = torch.Tensor(self.claims.astype(float))
-			self.papers_unique = torch.Tensor(self.papers_unique.astype(float))
+			self.cooc_unique = torch.as_tensor(self.cooc_unique)
+			self.claims = tensor(self.claims)
+			self.papers_unique = tensor(self.papers_unique)
 
 			if 'transform_C' in self.clustering_type:
 				self.claimsNet = nn.Sequential(
@@ -281,7 +356,7 @@ class ClusterNet(nn.Module):
 					nn.Softmax(dim=1)
 				)
 			elif 'align_C' in self.clustering_type:
-				self.claims_clusters = nn.Parameter(nn.init.eye_(torch.Tensor(self.claims.shape[0], NUM_CLUSTERS)), requires_grad=True)
+				self.claims_clusters = nn.Parameter(nn.init.eye_(torch.empty(self.claims.shape[0], NUM_CLUSTERS, dtype=torch_dtype())), requires_grad=True)
 
 		elif self.clustering_type in ['coordinate-transform', 'coordinate-align', 'compute-align']:
 			self.papers, self.claims, papers_clusters, claims_clusters, self.cooc = standalone_clustering(method=init_clustering_method)
@@ -292,10 +367,10 @@ class ClusterNet(nn.Module):
 			self.cooc_unique_C, self.index_C = np.unique(self.cooc, axis=0, return_index=True)
 			self.cooc_unique_P, self.index_P = np.unique(self.cooc, axis=1, return_index=True)
 
-			self.cooc_unique_C = torch.Tensor(self.cooc_unique_C.astype(float))
-			self.papers = torch.Tensor(self.papers.astype(float))
-			self.cooc_unique_P = torch.Tensor(self.cooc_unique_P.astype(float))
-			self.claims = torch.Tensor(self.claims.astype(float))
+			self.cooc_unique_C = torch.as_tensor(self.cooc_unique_C)
+			self.papers = tensor(self.papers)
+			self.cooc_unique_P = torch.as_tensor(self.cooc_unique_P)
+			self.claims = tensor(self.claims)
 
 			if 'coordinate-transform' in self.clustering_type:
 				self.claimsNet = nn.Sequential(
@@ -312,16 +387,19 @@ class ClusterNet(nn.Module):
 				)
 				
 			elif 'coordinate-align' in self.clustering_type:
-				self.claims_clusters = nn.Parameter(nn.init.eye_(torch.Tensor(self.claims.shape[0], NUM_CLUSTERS)), requires_grad=True)
-				self.papers_clusters = nn.Parameter(nn.init.eye_(torch.Tensor(self.papers.shape[0], NUM_CLUSTERS)), requires_grad=True)
+				self.claims_clusters = nn.Parameter(nn.init.eye_(torch.empty(self.claims.shape[0], NUM_CLUSTERS, dtype=torch_dtype())), requires_grad=True)
+				self.papers_clusters = nn.Parameter(nn.init.eye_(torch.empty(self.papers.shape[0], NUM_CLUSTERS, dtype=torch_dtype())), requires_grad=True)
 
 			elif 'compute-align' in self.clustering_type:
-				self.papers_clusters_orig = torch.Tensor(papers_clusters.values.astype(float))
-				self.claims_clusters_orig = torch.Tensor(claims_clusters.values.astype(float))
+				self.papers_clusters_orig = tensor(papers_clusters.values)
+				self.claims_clusters_orig = tensor(claims_clusters.values)
 
-				self.papers_clusters = nn.Parameter(torch.Tensor(papers_clusters.values.astype(float)), requires_grad=True)
-				self.claims_clusters = nn.Parameter(torch.Tensor(claims_clusters.values.astype(float)), requires_grad=True)
+				#parameters get their own copy, the originals stay fixed
+				self.papers_clusters = nn.Parameter(tensor(papers_clusters.values).clone(), requires_grad=True)
+				self.claims_clusters = nn.Parameter(tensor(claims_clusters.values).clone(), requires_grad=True)
 
+		#layers follow the precision setting too
+		self.to(torch_dtype())
 
 	def compute_permutation(self, epoch):
 		if 'transform_P' in self.clustering_type or 'align_P' in self.clustering_type: 
@@ -336,7 +414,7 @@ class ClusterNet(nn.Module):
 
 	def forward(self, batch):
 		if 'compute_C' in self.clustering_type:
-			L = self.cooc_unique[:, self.permutation[batch:batch+batch_size]]
+			L = self.cooc_unique[:, self.permutation[batch:batch+batch_size]].to(torch_dtype())
 			C = self.claims_unique
 
 			if 'transform_P' in self.clustering_type:
@@ -345,7 +423,7 @@ class ClusterNet(nn.Module):
 				P = self.papers_clusters[self.permutation[batch:batch+batch_size]]
 
 		elif 'compute_P' in self.clustering_type:
-			L = self.cooc_unique[self.permutation[batch:batch+batch_size]]
+			L = self.cooc_unique[self.permutation[batch:batch+batch_size]].to(torch_dtype())
 			P = self.papers_unique
 
 			if 'transform_C' in self.clustering_type:
@@ -356,30 +434,30 @@ class ClusterNet(nn.Module):
 		elif self.clustering_type in ['coordinate-transform', 'coordinate-align', 'compute-align']:
 		
 			if self.epoch%2==0:
-				L = self.cooc_unique_C[:, self.permutation[batch:batch+batch_size]]
+				L = self.cooc_unique_C[:, self.permutation[batch:batch+batch_size]].to(torch_dtype())
 
 				if  'compute-align' in self.clustering_type:
-					C = torch.Tensor(self.claims_clusters[self.index_C].detach().numpy().astype(float))
+					C = self.claims_clusters[self.index_C].detach()
 					P = self.papers_clusters[self.permutation[batch:batch+batch_size]]
 					self.P_orig = self.papers_clusters_orig[self.permutation[batch:batch+batch_size]]
 				elif 'coordinate-align' in self.clustering_type:
-					C = torch.Tensor(self.claims_clusters[self.index_C].detach().numpy().astype(float))
+					C = self.claims_clusters[self.index_C].detach()
 					P = self.papers_clusters[self.permutation[batch:batch+batch_size]]
 				elif 'coordinate-transform' in self.clustering_type:
-					C = torch.Tensor(self.claimsNet(self.claims[self.index_C]).detach().numpy().astype(float))
+					C = self.claimsNet(self.claims[self.index_C]).detach()
 					P = self.papersNet(self.papers[self.permutation[batch:batch+batch_size]])
 			else:
-				L = self.cooc_unique_P[self.permutation[batch:batch+batch_size]]
+				L = self.cooc_unique_P[self.permutation[batch:batch+batch_size]].to(torch_dtype())
 				
 				if'compute-align' in self.clustering_type:
-					P = torch.Tensor(self.papers_clusters[self.index_P].detach().numpy().astype(float))
+					P = self.papers_clusters[self.index_P].detach()
 					C = self.claims_clusters[self.permutation[batch:batch+batch_size]]
 					self.C_orig = self.claims_clusters_orig[self.permutation[batch:batch+batch_size]]
 				elif 'coordinate-align' in self.clustering_type:
-					P = torch.Tensor(self.papers_clusters[self.index_P].detach().numpy().astype(float))
+					P = self.papers_clusters[self.index_P].detach()
 					C = self.claims_clusters[self.permutation[batch:batch+batch_size]]
 				elif 'coordinate-transform' in self.clustering_type:
-					P = torch.Tensor(self.papersNet(self.papers[self.index_P]).detach().numpy().astype(float))
+					P = self.papersNet(self.papers[self.index_P]).detach()
 					C = self.claimsNet(self.claims[self.permutation[batch:batch+batch_size]])
 
 		return P, L, C
@@ -425,6 +503,7 @@ class ClusterNet(nn.Module):
 
 ############################### ######### ###############################
 
+@traced('compute_clusterings')
 def compute_clusterings(clustering_type, init_clustering_method=None):
 
 	if clustering_type in ['LDA', 'GSDMM', 'GMM', 'PCA-GMM', 'KMeans', 'PCA-KMeans']:
@@ -439,22 +518,34 @@ def compute_clusterings(clustering_type, init_clustering_method=None):
 
 	optimizer = optim.Adam(model.parameters(), lr=learning_rate) 
 
-	for epoch in range(num_epochs):
-		permutation = model.compute_permutation(epoch)
-
-		mean_loss = []
-		for batch in range(0, len(permutation), batch_size):
-			optimizer.zero_grad()
-			P, L, C = model.forward(batch)
-			loss = model.loss(P, L, C)
-			mean_loss.append(loss.detach().numpy())
-			loss.backward()
-			optimizer.step()
+	losses = []
+	with span('compute_clusterings/training:'+clustering_type, unit='batches', losses=losses, precision=precision) as training:
+		for epoch in range(num_epochs):
+			permutation = model.compute_permutation(epoch)
+
+			mean_loss = []
+			for batch in range(0, len(permutation), batch_size):
+				optimizer.zero_grad()
+				with torch.autocast('cpu', dtype=torch.bfloat16, enabled=precision == 'bfloat16'):
+					P, L, C = model.forward(batch)
+					loss = model.loss(P, L, C)
+				mean_loss.append(loss.item())
+				loss.backward()
+				optimizer.step()
+			training.count(len(mean_loss))
+			losses.append(float(np.mean(mean_loss)))
 
 	papers_clusters, claims_clusters, cooc = model.final_clusters()
 	return papers_clusters, claims_clusters, cooc
 
+def cache_clusterings(clustering_type, init_clustering_method=None):
+	papers_clusters, claims_clusters, _ = compute_clusterings(clustering_type, init_clustering_method)
+	if os.path.exists(sciclops_dir + 'cache/claims_dedup.tsv.bz2'):
+		claims_clusters = expand(claims_clusters, pd.read_csv(sciclops_dir + 'cache/claims_dedup.tsv.bz2', sep='\t'))
+	papers_clusters.to_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t')
+	claims_clusters.to_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
 
+@traced('eval_clusters')
 def eval_clusters(papers_clusters, claims_clusters, cooc):
 	#papers_clusters, claims_clusters, cooc = compute_clusterings('LDA', 'PCA-GMM')
 	#threshold for faster computation; it has to be 100% for full comparison
@@ -583,6 +674,4 @@ if __name__ == "__main__":
 	print(df.to_latex())
 	
 	NUM_CLUSTERS = 100
-	papers_clusters, claims_clusters, _ = compute_clusterings('compute-align-0.5', 'GMM')
-	papers_clusters.to_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t')
-	claims_clusters.to_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
+	cache_clusterings('compute-align-0.5', 'GMM')
@@ -1,3 +1,4 @@
+import ast
 import os
 import random
 import re
@@ -7,11 +8,15 @@ from urllib.parse import urlsplit
 import networkx as nx
 import numpy as np
 import pandas as pd
-import requests
 import spacy
 
+from claimbuster import ClaimBuster
+from claimskg import ClaimsKG
+from instrumentation import span, traced
+from sources import read_source
+
 ############################### CONSTANTS ###############################
-sciclops_dir = str(Path.home()) + '/data/sciclops/' 
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
 hn_vocabulary = set(map(str.lower, open(sciclops_dir + 'etc/hn_vocabulary/hn_vocabulary.txt').read().splitlines()))
 health = set(map(str.lower, open(sciclops_dir + 'etc/hn_vocabulary/health.txt').read().splitlines()))
 
@@ -23,63 +28,54 @@ LAMBDA = 0.3
 
 ################################ HELPERS ################################
 
+@traced('claimbuster')
 def claimbuster():
-    def fact_check(claim):
-        # Define the endpoint (url), payload (sentence to be scored), api-key (api-key is sent as an extra header)
-        api_endpoint = "https://idir.uta.edu/claimbuster/api/v2/score/text/"
-        request_headers = {"x-api-key": os.getenv('CLAIMBUSTER_KEY')}
-        payload = {"input_text": claim}
-        # Send the POST request to the API and store the api response
-        api_response = requests.post(url=api_endpoint, json=payload, headers=request_headers)
-        # Print out the JSON payload the API sent back
-        return api_response.json()
-    
-    df = pd.read_csv(str(Path.home()) + '/data/sciclops/etc/evaluation/raw_claims.csv')
-    df['fact_check'] = df['Scientific Claim'].apply(fact_check)
-    df['fact_check'] =  np.digitize(df['fact_check'].apply(lambda fc: fc['results'][0]['score']),[.2, .4, .6, .8, 1]) - 2
-    df.to_csv(str(Path.home()) + '/data/sciclops/etc/evaluation/claimbuster.csv', index=False)
-
-def ClaimsKG_query():
-#Query for https://data.gesis.org/claimskg/sparql
-
-	query = '''
-	PREFIX schema:<http://schema.org/>
-	PREFIX nif:<http://persistence.uni-leipzig.org/nlp2rdf/ontologies/nif-core#>
-	PREFIX :<http://data.gesis.org/claimskg/organization/>
-
-	SELECT ?claimText ?claimKeywords ?rating
-	(GROUP_CONCAT(DISTINCT ?claimEntity;separator=",") as ?claimEntities) 
-
-	WHERE {
-	?claim a schema:CreativeWork.
-	?claim schema:text ?claimText.
-	?claim schema:keywords ?claimKeywords.
-	?claim schema:mentions/nif:isString ?claimEntity.
-
-	?claimReview schema:itemReviewed ?claim.
-	?claimReview schema:reviewRating ?reviewRating.
-	?reviewRating schema:author :claimskg.
-	?reviewRating schema:alternateName ?rating.
-
-	FILTER( ?rating = "FALSE"@en || ?rating = "TRUE"@en) 
-
-	} GROUP BY ?claimText ?claimKeywords ?rating
-
-	offset 10000 limit 10000
-	'''
-	return query
-
-############################### ######### ###############################
-
-def enhance_context(max_related = 3):
-	nlp = spacy.load('en_core_web_lg')
-
-	claimsKG = pd.read_csv(sciclops_dir+'etc/claimKG/claims.csv')
-	claims_clusters = pd.read_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
-	papers_clusters = pd.read_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t').merge(pd.read_csv(sciclops_dir + 'cache/paper_details_v1.tsv.bz2', sep='\t')[['url', 'full_text']], on='url')
-
-
-	claims_clusters['cluster'] = claims_clusters[[str(i) for i in range(NUM_CLUSTERS)]].idxmax(axis=1)
+	client = ClaimBuster()
+	df = pd.read_csv(sciclops_dir + 'etc/evaluation/raw_claims.csv')
+	responses = client.score(df['Scientific Claim'].tolist())
+	client.close()
+	#claims that failed after all retries, or got no results, are left unscored
+	df['fact_check'] = [r['results'][0]['score'] if r and r.get('results') else np.nan for r in responses]
+	df['fact_check'] = np.where(df['fact_check'].isna(), np.nan, np.digitize(df['fact_check'].fillna(0), [.2, .4, .6, .8, 1]) - 2)
+	df.to_csv(sciclops_dir + 'etc/evaluation/claimbuster.csv', index=False)
+
+#Rank the related items of each claim by cosine similarity; each text is embedded once
+def rank_related(nlp, claims, related, k):
+	related = [ast.literal_eval(r) if isinstance(r, str) else r for r in related]
+
+	texts = list(dict.fromkeys(claims + [r[0] for l in related for r in l]))
+	position = {t:i for i,t in enumerate(texts)}
+	E = np.array([nlp.make_doc(t).vector for t in texts], dtype=np.float32)
+	norm = np.linalg.norm(E, axis=1, keepdims=True)
+	E = np.divide(E, norm, out=np.zeros_like(E), where=norm>0)
+
+	#rows sharing the same related list are scored with a single matrix product
+	groups = {}
+	for row, l in enumerate(related):
+		groups.setdefault(tuple(map(tuple, l)), []).append(row)
+
+	ranked = [None] * len(claims)
+	for rows in groups.values():
+		candidates = list(dict.fromkeys((r[0], r[1]) for r in related[rows[0]]))
+		if not candidates:
+			for row in rows:
+				ranked[row] = [('', '')] * k
+			continue
+		scores = E[[position[claims[row]] for row in rows]] @ E[[position[c[0]] for c in candidates]].T
+		top = min(k, len(candidates))
+		if top < len(candidates):
+			top_k = np.argpartition(-scores, top-1, axis=1)[:, :top]
+		else:
+			top_k = np.tile(np.arange(top), (len(rows), 1))
+		top_k = np.take_along_axis(top_k, np.argsort(-np.take_along_axis(scores, top_k, axis=1), axis=1, kind='stable'), axis=1)
+		for row, indices in zip(rows, top_k):
+			ranked[row] = [candidates[i] for i in indices] + [('', '')] * (k - top)
+
+	return ranked
+
+#Claims with their most likely cluster and a weight mixing popularity and outlet rating
+def weighted_claims(claims_clusters, num_clusters=None):
+	claims_clusters['cluster'] = claims_clusters[[str(i) for i in range(num_clusters or NUM_CLUSTERS)]].idxmax(axis=1)
 	claims_clusters = claims_clusters[['url', 'claim', 'popularity', 'cluster']]
 
 	claims_clusters['domain'] = claims_clusters.url.apply(lambda u: re.sub(r'^(http(s)?://)?(www\.)?', r'', urlsplit(u).netloc))
@@ -89,54 +85,80 @@ def enhance_context(max_related = 3):
 	claims_clusters['popularity'] = claims_clusters['popularity']/max(claims_clusters['popularity'])
 
 	claims_clusters['weight'] = LAMBDA * claims_clusters['popularity'] + (1-LAMBDA) * claims_clusters['rate']
+	return claims_clusters
 
+#Most central health/non-health term pairs of every cluster's weighted co-occurrence graph
+def topic_pairs(claims_clusters, num_clusters=None, max_pairs_per_cluster=5):
 	pairs = []
-	max_pairs_per_cluster = 5
-	for i in range(NUM_CLUSTERS):
+	for i in range(num_clusters or NUM_CLUSTERS):
 		claims = claims_clusters[claims_clusters['cluster'] == str(i)]
 		G = nx.Graph()
 		claims.apply(lambda c: (lambda s, w: [G.add_edge(e1, e2, weight=G.get_edge_data(e1, e2, default={'weight': 0})['weight'] + w) for e1 in s for e2 in s if e1 in health and e2 not in health])(set(c.claim.split()).intersection(hn_vocabulary), c.weight), axis=1)
 		if not nx.is_empty(G):
 			pairs += (lambda d: list(dict(sorted(d.items(), key=lambda x:x[1], reverse = True)[:max_pairs_per_cluster]).keys()))(nx.edge_betweenness_centrality(G, weight='weight'))
+	return pairs
 
-	claims_enhanced_context = []
-	for p in pairs:
-		claims = claims_clusters[claims_clusters.claim.str.contains(p[0]) & claims_clusters.claim.str.contains(p[1])][['claim', 'url']].values.tolist()
-		papers = papers_clusters[papers_clusters.full_text.str.contains(p[0]) & papers_clusters.full_text.str.contains(p[1])][['title', 'url']].values.tolist()
-		if not papers:
-			continue
-		kg = claimsKG[claimsKG.claimText.str.contains(p[0]) | claimsKG.claimText.str.contains(p[1])][['claimText', 'rating']].values.tolist()
-		
-		for c in claims:
-			claims_enhanced_context += [[p[0]+'-'+p[1], c[0], c[1], claims, papers, kg]]
-			claims_enhanced_context += [[p[1]+'-'+p[0], c[0], c[1], claims, papers, kg]]
-
-	claims_enhanced_context = pd.DataFrame(claims_enhanced_context)
-
-	claims_enhanced_context = claims_enhanced_context.drop_duplicates(subset=1)
-
-	def find_most_similar(claim, related, pos):
-		related = eval(related)
-		if len(related) <= pos:
-			return ('', '')
-		d = {(r[0],r[1]):nlp(claim).similarity(nlp(r[0])) for r in related}
-		return sorted(d.items(), key=lambda x:x[1], reverse = True)[pos][0]
+############################### ######### ###############################
 
-	claims_enhanced_context['topic'] = claims_enhanced_context['0']
-	claims_enhanced_context['main_claim'] = claims_enhanced_context['1']
-	claims_enhanced_context['main_claim_URL'] = claims_enhanced_context['2']
+@traced('enhance_context')
+def enhance_context(max_related = 3, ann_candidates = 0):
+	with span('enhance_context/loading'):
+		nlp = spacy.load('en_core_web_lg')
 
-	for i in range(max_related):
-		claims_enhanced_context['related_claim_'+str(i+1)], claims_enhanced_context['related_claim_'+str(i+1)+'_URL'] = zip(*claims_enhanced_context.apply(lambda x: find_most_similar(x['1'], x['3'], i), axis=1))
+		claimsKG = ClaimsKG()
+		if not len(claimsKG):
+			claimsKG.ingest(sciclops_dir+'etc/claimKG/claims.csv')
+		claims_clusters = pd.read_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
+		papers_clusters = pd.read_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t').merge(read_source('paper_texts', ['url', 'full_text']), on='url')
 
-	for i in range(max_related):
-		claims_enhanced_context['related_paper_'+str(i+1)], claims_enhanced_context['related_paper_'+str(i+1)+'_URL'] = zip(*claims_enhanced_context.apply(lambda x: find_most_similar(x['1'], x['4'], i), axis=1))
 
-	for i in range(max_related):
-		claims_enhanced_context['related_factcheck_'+str(i+1)], claims_enhanced_context['related_factcheck_'+str(i+1)+'_LABEL'] = zip(*claims_enhanced_context.apply(lambda x: find_most_similar(x['1'], x['5'], i), axis=1))
+	claims_clusters = weighted_claims(claims_clusters)
 
+	with span('enhance_context/topic_pairs', items=NUM_CLUSTERS, unit='clusters'):
+		pairs = topic_pairs(claims_clusters)
 
-	claims_enhanced_context = claims_enhanced_context.drop([str(i) for i in range(6)], axis=1)
+	with span('enhance_context/related_items', items=len(pairs), unit='pairs'):
+		claims_enhanced_context = []
+		for p in pairs:
+			claims = claims_clusters[claims_clusters.claim.str.contains(p[0]) & claims_clusters.claim.str.contains(p[1])][['claim', 'url']].values.tolist()
+			papers = papers_clusters[papers_clusters.full_text.str.contains(p[0]) & papers_clusters.full_text.str.contains(p[1])][['title', 'url']].values.tolist()
+			if not papers:
+				continue
+			kg = [list(r) for r in claimsKG.search([p[0], p[1]])]
+		
+			for c in claims:
+				claims_enhanced_context += [[p[0]+'-'+p[1], c[0], c[1], claims, papers, kg]]
+				claims_enhanced_context += [[p[1]+'-'+p[0], c[0], c[1], claims, papers, kg]]
+		claimsKG.close()
+
+	claims_enhanced_context = pd.DataFrame(claims_enhanced_context, columns=['topic', 'main_claim', 'main_claim_URL', 'claims', 'papers', 'factchecks'])
+
+	claims_enhanced_context = claims_enhanced_context.drop_duplicates(subset='main_claim')
+
+	#nearest claims and papers across the whole corpus, next to the keyword matches of the topic
+	if ann_candidates:
+		from ann import load_index
+		from clustering import clean_claim, embed_clean
+		with span('enhance_context/ann_candidates', items=len(claims_enhanced_context), unit='claims'):
+			#queries are cleaned and embedded the way the indexed claims and papers were; claims that cleaning empties get no candidates
+			cleaned = [clean_claim(c) for c in claims_enhanced_context['main_claim']]
+			rows = [i for i, c in enumerate(cleaned) if c]
+			queries = np.array([embed_clean(cleaned[i]) for i in rows], dtype=np.float32)
+			for group in ['claims', 'papers']:
+				neighbours = [[] for _ in cleaned]
+				if rows:
+					for i, ns in zip(rows, load_index(group).query(queries, ann_candidates)):
+						neighbours[i] = ns
+				claims_enhanced_context[group] = [l + [list(n) for n in ns] for l, ns in zip(claims_enhanced_context[group], neighbours)]
+
+	with span('enhance_context/ranking', items=len(claims_enhanced_context), unit='claims'):
+		for group, suffix in [('claims', 'claim'), ('papers', 'paper'), ('factchecks', 'factcheck')]:
+			ranked = rank_related(nlp, claims_enhanced_context['main_claim'].tolist(), claims_enhanced_context[group].tolist(), max_related)
+			for i in range(max_related):
+				claims_enhanced_context['related_'+suffix+'_'+str(i+1)] = [r[i][0] for r in ranked]
+				claims_enhanced_context['related_'+suffix+'_'+str(i+1)+('_LABEL' if group == 'factchecks' else '_URL')] = [r[i][1] for r in ranked]
+
+	claims_enhanced_context = claims_enhanced_context.drop(['claims', 'papers', 'factchecks'], axis=1)
 
 	claims_enhanced_context.to_csv(sciclops_dir + 'evaluation/claims_enhanced_context.csv', index=False)
 
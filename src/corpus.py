@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import Dataset
+from transformers import AutoTokenizer
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+corpus_dir = sciclops_dir + 'cache/corpus/'
+
+#corpus name -> (csv file, text column); add further news or science corpora here
+CORPORA = {
+	'abcnews': (sciclops_dir + 'etc/million_headlines/abcnews.csv', 'headline_text'),
+}
+
+BLOCK_SIZE = 128
+#expected and maximum shard length, in texts and in multiples of SHARD_LINES
+SHARD_LINES = 100000
+MAX_SHARD = 4
+WORKERS = os.cpu_count()
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+tokenizer = None
+
+def init_tokenizer(t):
+	global tokenizer
+	tokenizer = t
+
+#Token ids of a shard, packed into fixed-length blocks wrapped with [CLS] ... [SEP]
+def tokenize_shard(args):
+	texts, shard_file, block_size = args
+
+	ids = tokenizer(texts, add_special_tokens=False)['input_ids']
+	ids = np.fromiter((t for l in ids for t in l + [tokenizer.sep_token_id]), dtype=np.int64)
+
+	length = block_size - 2
+	blocks = ids[:len(ids) // length * length].reshape(-1, length)
+	blocks = np.hstack([np.full((len(blocks), 1), tokenizer.cls_token_id), blocks, np.full((len(blocks), 1), tokenizer.sep_token_id)])
+
+	dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max else np.int32
+	np.save(shard_file + '.tmp.npy', blocks.astype(dtype))
+	os.replace(shard_file + '.tmp.npy', shard_file)
+	return shard_file
+
+#Shards of a corpus, keyed by their content. A shard ends after a text whose hash is 0 modulo shard_lines (or at
+#MAX_SHARD times that length), so inserting rows only changes the shard they land in and later shards keep their keys
+def corpus_shards(name, csv_file, column, shard_lines=SHARD_LINES):
+	texts = []
+	for chunk in pd.read_csv(csv_file, usecols=[column], chunksize=shard_lines):
+		for text in chunk[column].dropna().astype(str):
+			texts += [text]
+			if zlib.crc32(text.encode('utf-8')) % shard_lines == 0 or len(texts) >= MAX_SHARD * shard_lines:
+				yield shard_name(name, texts), texts
+				texts = []
+	if texts:
+		yield shard_name(name, texts), texts
+
+def shard_name(name, texts):
+	return name + '-' + hashlib.sha1('\n'.join(texts).encode('utf-8')).hexdigest()[:16]
+
+#Shards of a tokenizer live under its name and a hash of its vocabulary
+def tokenizer_dir(t):
+	vocabulary = hashlib.sha1(json.dumps(sorted(t.get_vocab().items())).encode('utf-8')).hexdigest()[:12]
+	return corpus_dir + re.sub(r'\W+', '_', t.name_or_path) + '-' + vocabulary + '/'
+
+############################### ######### ###############################
+
+#Fixed-length token blocks of all shards, memory-mapped
+class PackedCorpus(Dataset):
+	def __init__(self, shard_files):
+		self.shards = [np.load(f, mmap_mode='r') for f in shard_files]
+		self.offsets = np.cumsum([0] + [len(s) for s in self.shards])
+
+	def __len__(self):
+		return int(self.offsets[-1])
+
+	def __getitem__(self, i):
+		shard = np.searchsorted(self.offsets, i, side='right') - 1
+		return torch.from_numpy(self.shards[shard][i - self.offsets[shard]].astype(np.int64))
+
+#simpletransformers dataset_class: the file path is a shard list written by prepare_corpus
+class ShardListDataset(PackedCorpus):
+	def __init__(self, tokenizer, args, file_path, mode, block_size):
+		super().__init__(open(file_path).read().splitlines())
+
+#Tokenize every corpus once per tokenizer and block size, streaming the new shards to `workers` processes and
+#deleting the shards no corpus has anymore; returns the file listing the shards, in corpus order
+def prepare_corpus(tokenizer, corpora=CORPORA, block_size=BLOCK_SIZE, workers=WORKERS):
+	output_dir = tokenizer_dir(tokenizer) + str(block_size) + '/'
+	os.makedirs(output_dir, exist_ok=True)
+
+	shard_files, pending, pool = [], [], None
+	try:
+		for name, (csv_file, column) in corpora.items():
+			for shard, texts in corpus_shards(name, csv_file, column):
+				shard_files += [output_dir + shard + '.npy']
+				if os.path.exists(shard_files[-1]):
+					continue
+				pool = pool or Pool(workers, initializer=init_tokenizer, initargs=(tokenizer,))
+				pending += [pool.apply_async(tokenize_shard, ((texts, shard_files[-1], block_size),))]
+				#at most two shards per process are held in memory
+				if len(pending) >= 2 * workers:
+					pending.pop(0).get()
+		for p in pending:
+			p.get()
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+
+	for f in os.listdir(output_dir):
+		if f.endswith('.npy') and f.rsplit('-', 1)[0] in corpora and output_dir + f not in shard_files:
+			os.remove(output_dir + f)
+
+	shards_file = output_dir + 'shards-' + '-'.join(corpora) + '.txt'
+	open(shards_file, 'w').write('\n'.join(shard_files))
+	return shards_file
+
+
+if __name__ == "__main__":
+	for tokenizer_name in ['bert-base-uncased', 'allenai/scibert_scivocab_uncased']:
+		shards_file = prepare_corpus(AutoTokenizer.from_pretrained(tokenizer_name))
+		print(tokenizer_name, len(PackedCorpus(open(shards_file).read().splitlines())), 'blocks')
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+############################### CONSTANTS ###############################
+CHUNKSIZE = 100000
+
+#Column mappings of the two MTurk result layouts
+MTURK_SCHEMAS = {
+	#round 1: the answer is a single label column
+	'label': {
+		'columns': {'Input.sentence':'sentence', 'Input.golden_label':'golden_label', 'Input.type':'type', 'Answer.claim.label':'label', 'LifetimeApprovalRate':'approval', 'WorkerId':'worker'},
+		'items': ['sentence', 'type', 'golden_label'],
+		'labels': {'Yes':1, 'No':0},
+	},
+	#round 2: one boolean column per answer
+	'one_hot': {
+		'columns': {'Input.sentence':'sentence', 'Answer.False.False':'False', 'Answer.NA.NA':'NA', 'Answer.True.True':'True', 'WorkerId':'worker'},
+		'items': ['sentence'],
+		'answers': ['False', 'NA', 'True'],
+		'exclude': ['NA'],
+		'labels': {'True':1, 'False':0},
+	},
+}
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+#One (items, worker, label) row per answer
+def normalize_answers(df, schema):
+	df = df.rename(columns=schema['columns'])
+
+	#remove spam crowdworkers
+	if 'approval' in df:
+		df = df[df.approval.astype(str).str.extract(r'^(\d+)', expand=False).astype(int) != 0]
+
+	if 'answers' in schema:
+		df = df[~df[schema['exclude']].astype(bool).any(axis=1)]
+		answers = df[schema['answers']].values.astype(bool)
+		df = df.assign(label=np.array(schema['answers'])[answers.argmax(axis=1)])
+
+	return df[schema['items'] + (['worker'] if 'worker' in df else []) + ['label']]
+
+#Answer counts per (items, worker, label), accumulated over the chunks of a results file
+def read_votes(results_file, schema, chunksize=CHUNKSIZE):
+	keys = None
+	counts = []
+	for chunk in pd.read_csv(results_file, usecols=lambda c: c in schema['columns'], chunksize=chunksize):
+		chunk = normalize_answers(chunk, schema)
+		keys = list(chunk.columns)
+		counts += [chunk.groupby(keys, sort=False).size()]
+	return pd.concat(counts).groupby(level=keys).sum()
+
+#Iterative Dawid-Skene: returns the label posteriors of every item
+def dawid_skene(items, workers, labels, weights, num_items, num_workers, num_labels, max_iter=100, tol=1.e-6, smoothing=1.e-2):
+	#initialize with the (weighted) majority vote
+	T = np.zeros((num_items, num_labels))
+	np.add.at(T, (items, labels), weights)
+	T /= T.sum(axis=1, keepdims=True)
+
+	for _ in range(max_iter):
+		#M-step: class priors and worker confusion matrices
+		priors = T.mean(axis=0)
+		confusion = np.full((num_workers, num_labels, num_labels), smoothing)
+		np.add.at(confusion, (workers, slice(None), labels), T[items] * weights[:, None])
+		confusion /= confusion.sum(axis=2, keepdims=True)
+
+		#E-step: item posteriors given the confusion matrices
+		log_T = np.tile(np.log(priors), (num_items, 1))
+		np.add.at(log_T, items, np.log(confusion[workers, :, labels]) * weights[:, None])
+		log_T -= log_T.max(axis=1, keepdims=True)
+		T_new = np.exp(log_T)
+		T_new /= T_new.sum(axis=1, keepdims=True)
+
+		converged = np.abs(T_new - T).max() < tol
+		T = T_new
+		if converged:
+			break
+
+	return T
+
+############################### ######### ###############################
+
+#Majority label and strong (margin > 1) / weak (margin = 1) agreement per item; ties are dropped
+def aggregate(results_file, schema, method='majority', chunksize=CHUNKSIZE):
+	votes = read_votes(results_file, schema, chunksize)
+	items = schema['items']
+
+	counts = votes.groupby(level=items + ['label']).sum().unstack('label', fill_value=0)
+	C = counts.values
+	top = np.sort(C, axis=1)
+	margin = top[:, -1] - (top[:, -2] if C.shape[1] > 1 else 0)
+
+	df = counts.index.to_frame(index=False)
+	df['label'] = counts.columns.values[C.argmax(axis=1)]
+	df['agreement'] = np.where(margin > 1, 'strong', np.where(margin == 1, 'weak', None))
+
+	if method == 'dawid_skene':
+		if 'worker' not in votes.index.names:
+			raise ValueError('Dawid-Skene aggregation needs a WorkerId column')
+		index = votes.index.to_frame(index=False)
+		item_codes = pd.MultiIndex.from_frame(counts.index.to_frame(index=False)).get_indexer(pd.MultiIndex.from_frame(index[items]))
+		worker_codes, _ = pd.factorize(index['worker'])
+		label_codes = counts.columns.get_indexer(index['label'])
+
+		T = dawid_skene(item_codes, worker_codes, label_codes, votes.values.astype(float), len(counts), worker_codes.max() + 1, len(counts.columns))
+		df['label'] = counts.columns.values[T.argmax(axis=1)]
+		df['confidence'] = T.max(axis=1)
+
+	df = df.dropna(subset=['agreement'])
+	df['label'] = df['label'].map(schema['labels'])
+	return df.dropna(subset=['label'])
@@ -0,0 +1,101 @@
+import re
+import zlib
+
+import numpy as np
+
+############################### CONSTANTS ###############################
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 128
+#32 bands of 4 rows: pairs above ~0.4 Jaccard become candidates
+BANDS = 32
+THRESHOLD = 0.8
+#Mersenne prime of the universal hash family (a*x + b) mod p
+PRIME = (1 << 31) - 1
+SEED = 42
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+#crc32 hashes of the word shingles of a lowercased, punctuation-free text
+def shingles(text, size=SHINGLE_SIZE):
+	words = re.sub(r'[^a-z0-9 ]', ' ', str(text).lower()).split()
+	grams = {' '.join(words[i:i+size]) for i in range(max(1, len(words) - size + 1))}
+	return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.int64, count=len(grams))
+
+def hash_family(num_permutations=NUM_PERMUTATIONS, seed=SEED):
+	rng = np.random.default_rng(seed)
+	return rng.integers(1, PRIME, num_permutations, dtype=np.int64), rng.integers(0, PRIME, num_permutations, dtype=np.int64)
+
+#One row of minimum hash values per text
+def minhash(texts, num_permutations=NUM_PERMUTATIONS, seed=SEED):
+	a, b = hash_family(num_permutations, seed)
+	signatures = np.full((len(texts), num_permutations), PRIME, dtype=np.int64)
+	for i, text in enumerate(texts):
+		x = shingles(text) % PRIME
+		if len(x):
+			signatures[i] = ((a[:, None] * x[None, :] + b[:, None]) % PRIME).min(axis=1)
+	return signatures
+
+def find(parent, i):
+	while parent[i] != i:
+		parent[i] = parent[parent[i]]
+		i = parent[i]
+	return i
+
+def union(parent, i, j):
+	i, j = find(parent, i), find(parent, j)
+	if i != j:
+		parent[max(i, j)] = min(i, j)
+
+############################### ######### ###############################
+
+#Group label per text: texts sharing an LSH bucket and with estimated Jaccard >= threshold end up in one group
+def near_duplicates(texts, threshold=THRESHOLD, bands=BANDS, num_permutations=NUM_PERMUTATIONS):
+	signatures = minhash(texts, num_permutations)
+	rows = num_permutations // bands
+	parent = np.arange(len(texts))
+
+	for band in range(bands):
+		#each text is compared with the first text of its bucket
+		keys = np.ascontiguousarray(signatures[:, band*rows:(band+1)*rows]).view(np.dtype((np.void, 8*rows))).ravel()
+		_, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+		heads = first[bucket.ravel()]
+		candidates = np.nonzero(heads != np.arange(len(texts)))[0]
+		similar = candidates[(signatures[candidates] == signatures[heads[candidates]]).mean(axis=1) >= threshold]
+		for i, j in zip(heads[similar], similar):
+			union(parent, i, j)
+
+	return np.array([find(parent, i) for i in range(len(texts))])
+
+#Collapse near-duplicate claims into the most popular claim of their group, with merged refs and summed popularity;
+#the mapping keeps every original (url, claim, popularity) next to its canonical (url, claim)
+def collapse(claims, threshold=THRESHOLD):
+	claims = claims.reset_index(drop=True)
+	if threshold is None or claims.empty:
+		groups = np.arange(len(claims))
+	else:
+		groups = near_duplicates(claims['claim'].tolist(), threshold)
+	claims['group'] = groups
+
+	canonical = claims.sort_values('popularity', ascending=False, kind='stable').drop_duplicates(subset='group').set_index('group')
+	mapping = claims[['group', 'url', 'claim', 'popularity']].join(canonical[['url', 'claim']].rename(columns={'url': 'canonical_url', 'claim': 'canonical_claim'}), on='group')
+
+	merged = claims.groupby('group').agg(refs=('refs', lambda r: set().union(*r)), popularity=('popularity', 'sum'))
+	canonical = canonical.drop(['refs', 'popularity'], axis=1).join(merged)
+	canonical = canonical.loc[sorted(canonical.index)].reset_index(drop=True)[claims.columns.drop('group')]
+
+	return canonical, mapping.drop('group', axis=1)[['canonical_url', 'canonical_claim', 'url', 'claim', 'popularity']]
+
+#Rows indexed by canonical (url, claim, popularity), repeated for every original claim they stand for
+def expand(df, mapping):
+	names = df.index.names
+	df = df.reset_index()
+	df = mapping.merge(df.drop('popularity', axis=1), left_on=['canonical_url', 'canonical_claim'], right_on=['url', 'claim'], suffixes=('', '_canonical'))
+	return df.drop(['canonical_url', 'canonical_claim', 'url_canonical', 'claim_canonical'], axis=1).set_index(names)
+
+#Inverse of expand on a flat frame: one row per canonical (url, claim), with the summed popularity of the claims it stands for
+def contract(df, mapping):
+	df = df.merge(mapping.drop('popularity', axis=1).drop_duplicates(subset=['url', 'claim']), on=['url', 'claim'])
+	df['popularity'] = df.groupby(['canonical_url', 'canonical_claim'], sort=False)['popularity'].transform('sum')
+	df['url'], df['claim'] = df['canonical_url'], df['canonical_claim']
+	return df.drop_duplicates(subset=['url', 'claim']).drop(['canonical_url', 'canonical_claim'], axis=1).reset_index(drop=True)
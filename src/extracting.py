@@ -1,130 +1,222 @@
+import functools
+import hashlib
+import heapq
+import json
+import math
 import os
 import random
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import networkx as nx
 import numpy as np
 import pandas as pd
 import spacy
-from sklearn.model_selection import KFold
+from sklearn.model_selection import KFold, StratifiedKFold
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
 from simpletransformers.classification import ClassificationModel
 from simpletransformers.language_modeling import (LanguageModelingArgs, LanguageModelingModel)
 from sklearn.metrics import precision_recall_fscore_support
 
+from corpus import CORPORA, ShardListDataset, prepare_corpus
+from crowd import MTURK_SCHEMAS, aggregate
+from instrumentation import span, traced
+from sources import iter_source, read_graph, read_source
+
 ############################### CONSTANTS ###############################
-scilens_dir = str(Path.home()) + '/data/scilens/cache/diffusion_graph/scilens_3M/'
-sciclops_dir = str(Path.home()) + '/data/sciclops/'
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
 hn_vocabulary = open(sciclops_dir + 'etc/hn_vocabulary/hn_vocabulary.txt').read().splitlines()
 action = open(sciclops_dir + 'etc/keywords/action.txt').read().splitlines()
 person = open(sciclops_dir + 'etc/keywords/person.txt').read().splitlines()
 study = open(sciclops_dir + 'etc/keywords/study.txt').read().splitlines()
 
 
-np.random.seed(42)
+SEED = 42
+np.random.seed(SEED)
 
 CLAIM_THRESHOLD = 10
 LIFT_THRESHOLD = .8
+
+results_file = 'results.jsonl'
 ############################### ######### ###############################
 
 ################################ HELPERS ################################
 
-#Read diffusion graph
-def read_graph(graph_file):
-	return nx.from_pandas_edgelist(pd.read_csv(graph_file, sep='\t', header=None), 0, 1, create_using=nx.DiGraph())
+#Sentence vectors, computed once per spaCy model and list of sentences and cached on disk
+def embed(sentences):
+	model = nlp.meta['lang'] + '_' + nlp.meta['name'] + '-' + nlp.meta['version']
+	key = hashlib.sha1('\n'.join([model] + sentences).encode('utf-8')).hexdigest()
+	cache_file = sciclops_dir + 'cache/vectors/' + key + '.npy'
+	if os.path.exists(cache_file):
+		return np.load(cache_file)
+
+	#doc vectors only need the tokenizer and the static word vectors
+	with span('embed', items=len(sentences), unit='sentences'):
+		X = np.array([d.vector for d in nlp.pipe(sentences, disable=nlp.pipe_names)])
+	os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+	np.save(cache_file, X)
+	return X
+
+def run_fold(fit_predict, X, y, train_index, test_index, args, kwargs):
+	with span('cross_validate/fold', items=len(train_index), unit='sentences') as fold:
+		y_pred = fit_predict(*args, X, y, train_index, test_index, **kwargs)
+	return {'accuracy': accuracy_score(list(y[test_index]), list(y_pred)), 'seconds': fold.wall}
+
+#K-fold evaluation of fit_predict(*args, X, y, train_index, test_index, **kwargs), folds run in a process pool
+def cross_validate(fit_predict, X, y, args=(), kwargs=None, fold=5, stratified=True, seed=SEED, workers=None):
+	kwargs = kwargs or {}
+	kf = (StratifiedKFold if stratified else KFold)(n_splits=fold, shuffle=True, random_state=seed)
+
+	start = time.perf_counter()
+	if workers == 1:
+		folds = [run_fold(fit_predict, X, y, train_index, test_index, args, kwargs) for train_index, test_index in kf.split(X, y)]
+	else:
+		with ProcessPoolExecutor(workers or fold) as executor:
+			folds = list(executor.map(run_fold, *zip(*[(fit_predict, X, y, train_index, test_index, args, kwargs) for train_index, test_index in kf.split(X, y)])))
 
-#data
-nlp = spacy.load('en_core_web_lg')
-articles = pd.read_csv(scilens_dir + 'article_details_v3.tsv.bz2', sep='\t').drop_duplicates(subset='url').set_index('url')
-tweets = pd.read_csv(scilens_dir + 'tweet_details_v1.tsv.bz2', sep='\t').drop_duplicates(subset='url').set_index('url')
-G = read_graph(scilens_dir + 'diffusion_graph_v7.tsv.bz2')
+	return {'folds': folds, 'accuracy': np.mean([f['accuracy'] for f in folds]), 'stratified': stratified, 'seed': seed, 'seconds': time.perf_counter() - start}
 
+#Precision/recall/F1 against the crowd labels, for each level of crowd agreement
+def crowd_results(df, model, training_set, seconds):
+	for crowd_agreement in ['strong', 'weak']:
+		d = df[df.agreement == crowd_agreement]
+		#no positive predictions (or labels) score 0 rather than NaN, which is not valid JSON
+		precision, recall, f1, _ = precision_recall_fscore_support(d['label'], d['pred'], average='binary', zero_division=0)
+		write_result({'model': model, 'training_set': training_set, 'crowd_agreement': crowd_agreement, 'precision': precision, 'recall': recall, 'f1': f1, 'seconds': seconds})
 
-def annotation_sampling(num, max_sents=5):
-	sentences = articles[['title', 'full_text']].sample(num)
-	sentences = sentences.apply(lambda r: [r['title']] + [re.sub('\n', '', s.text) for _,s in zip(range(max_sents), nlp(r['full_text']).sents) if len(s) >= CLAIM_THRESHOLD and s[0].is_upper], axis=1)
-	weights = sentences.apply(lambda l: [len(l) - l.index(s) for s in l])
-	
-	df = pd.DataFrame([random.choices(sentences[i], weights[i])[0] for i in range(num)], columns=['sentence'])
+def write_result(result, results_file=results_file):
+	result = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), **result}
+	with open(results_file, 'a+') as f: f.write(json.dumps(result, default=float) + '\n')
+
+#data
+nlp = spacy.load('en_core_web_lg')
+#sentence splitting only needs the dependency parser
+NON_PARSER_PIPES = [p for p in nlp.pipe_names if p not in ['tok2vec', 'parser']]
+
+#Articles, tweets and diffusion graph of the lift baseline, loaded on first use
+@functools.lru_cache(maxsize=None)
+def lift_data():
+	with span('extracting/loading'):
+		articles = read_source('articles', ['url', 'title', 'full_text'], unique='url').set_index('url')
+		tweets = read_source('tweets', ['url', 'full_text', 'popularity'], unique='url').set_index('url')
+		G = read_graph()
+	return articles, tweets, G
+
+#Unique articles of the bz2 source, read chunk by chunk
+def stream_articles(columns, chunksize=10000):
+	seen = set()
+	for chunk in iter_source('articles', ['url']+columns, chunksize):
+		chunk = chunk.dropna(subset=['full_text']).drop_duplicates(subset='url')
+		chunk = chunk[~chunk.url.isin(seen)]
+		seen.update(chunk.url)
+		yield from chunk[columns].itertuples(index=False)
+
+#Weighted reservoir sampling (Efraimidis-Spirakis): num items in one pass, with probability proportional to weight
+def weighted_reservoir(items, num, rng, weights=None):
+	reservoir = []
+	for i, item in enumerate(items):
+		w = 1.0 if weights is None else weights[i]
+		if w <= 0:
+			continue
+		key = math.log(1.0 - rng.random()) / w
+		if len(reservoir) < num:
+			heapq.heappush(reservoir, (key, i, item))
+		elif key > reservoir[0][0]:
+			heapq.heapreplace(reservoir, (key, i, item))
+	return [item for _, _, item in sorted(reservoir, key=lambda r: r[1])]
+
+#shared by the samplers, so that successive samples differ and a run is still reproducible
+sampling_rng = random.Random(SEED)
+
+@traced('annotation_sampling')
+def annotation_sampling(num, max_sents=5, seed=None):
+	rng = sampling_rng if seed is None else random.Random(seed)
+	sample = weighted_reservoir(stream_articles(['title', 'full_text']), num, rng)
+
+	sentences = []
+	for (title, _), doc in zip(sample, nlp.pipe((t for _, t in sample), disable=NON_PARSER_PIPES)):
+		candidates = [title] + [re.sub('\n', '', s.text) for _,s in zip(range(max_sents), doc.sents) if len(s) >= CLAIM_THRESHOLD and s[0].is_upper]
+		#earlier sentences are more likely to be picked
+		sentences += weighted_reservoir(candidates, 1, rng, [len(candidates) - i for i in range(len(candidates))])
+
+	df = pd.DataFrame(sentences, columns=['sentence'])
 	df.to_csv(sciclops_dir + 'etc/arguments/validation_set.csv', index=False)
 
-def negative_sampling(num, random_negative=False, max_sents=10):
+@traced('negative_sampling')
+def negative_sampling(num, random_negative=False, max_sents=10, seed=None):
+	#separate training and testing negative samples: every call draws on from the shared generator
+	rng = sampling_rng if seed is None else random.Random(seed)
+	sample = weighted_reservoir(stream_articles(['full_text']), num, rng)
+
 	if random_negative:
-		negative_samples = articles['full_text'].sample(num)
-		negative_samples = negative_samples.apply(lambda s: random.choice(list(nlp(s).sents)).text).dropna().to_list()
+		negative_samples = [rng.choice(list(doc.sents)).text for doc in nlp.pipe((t for t, in sample), disable=NON_PARSER_PIPES)]
 	else:
-		#separate training and testing negative samples
-		negative_samples = articles['full_text'].sample(num)
-		#split to list of sentences in list of paragraphs
-		negative_samples = negative_samples.apply(lambda t: [[re.sub('\n', '', s.text) for _,s in zip(range(max_sents), nlp(p).sents) if len(s) >= CLAIM_THRESHOLD] for p in t.split('\n')[2:-5] if p])
-		#compute the probability of a sentence NOT to be a claim
-		negative_samples = negative_samples.apply(lambda t: [(s, (t.index(p)/len(t))*(p.index(s)/len(p))) for p in t for s in p])
-		#keep the sentence with the max probability
-		negative_samples = negative_samples.apply(lambda s: (sorted(s, key=lambda i: i[1])[0][0]) if s else np.nan).dropna().to_list()
-			
+		#split to paragraphs, remembering the article and the position of each paragraph
+		paragraphs = [(p, (a, i, len(t))) for a, (text,) in enumerate(sample) for t in [[p for p in text.split('\n')[2:-5] if p]] for i, p in enumerate(t)]
+
+		#keep per article the sentence with the minimum (paragraph position) * (sentence position) score
+		best = {}
+		for doc, (a, i, n) in nlp.pipe(paragraphs, disable=NON_PARSER_PIPES, as_tuples=True):
+			sents = [re.sub('\n', '', s.text) for _,s in zip(range(max_sents), doc.sents) if len(s) >= CLAIM_THRESHOLD]
+			for j, s in enumerate(sents):
+				score = (i/n)*(j/len(sents))
+				if a not in best or score < best[a][0]:
+					best[a] = (score, s)
+		negative_samples = [best[a][1] for a in sorted(best)]
+
 	negative_samples = pd.DataFrame(negative_samples, columns=['sentence'])
 	negative_samples['label'] = 0
 
 	return negative_samples
 
-def process_eval_dataset():
+@traced('process_eval_dataset')
+def process_eval_dataset(method='majority'):
 	#round 1
-	df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_old.csv')
-
-	df = df[['Input.sentence', 'Input.golden_label', 'Input.type', 'Answer.claim.label', 'LifetimeApprovalRate']]
-	df = df.rename(columns={'Input.sentence':'sentence', 'Input.golden_label':'golden_label', 'Input.type':'type', 'Answer.claim.label':'label', 'LifetimeApprovalRate':'approval'})
-
-	#remove spam crowdworkers
-	df = df[df.approval.apply(lambda x: int(re.sub(r'\%.*', '', x))) != 0]
-
-	#aggregate results from crowdworkers
-	df = pd.DataFrame(df.groupby(['sentence', 'type', 'golden_label'])['label'].apply(lambda x: (lambda c: (c.index[0], 'strong') if c.get(0) - c.get(1, default=0) > 1 else (c.index[0], 'weak') if c.get(0) - c.get(1, default=0) == 1 else np.nan)(x.value_counts())).apply(pd.Series))
-
-	df = df.rename(columns={0:'label', 1: 'agreement'}).reset_index()
-	df.label = df.label.map({'Yes':1, 'No':0})
-	
-	df = df.dropna()[['sentence', 'label', 'agreement']]
-	
-	df1 = df.copy()
+	df1 = aggregate(sciclops_dir + 'etc/arguments/mturk_results_old.csv', MTURK_SCHEMAS['label'], method)
 
 	#round 2
-	df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results.csv')
-
-	df = df.rename(columns={'Input.sentence':'sentence', 'Answer.False.False':'False', 'Answer.NA.NA':'NA', 'Answer.True.True':'True'})
-	df = df[['sentence', 'False', 'NA', 'True']]
-	df = df[df['NA']==False]
+	df2 = aggregate(sciclops_dir + 'etc/arguments/mturk_results.csv', MTURK_SCHEMAS['one_hot'], method)
 
-	df = df.groupby('sentence').idxmax(axis=1).reset_index().rename(columns={ 0:'label'})[['sentence', 'label']]
+	df = pd.concat([df1, df2])[['sentence', 'label', 'agreement']]
+	df.to_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t', index=False)
 
-	df = pd.DataFrame(df.groupby('sentence').apply(lambda x: (lambda c: (c.index[0][1], 'strong') if c.get(0) - c.get(1, default=0) > 1 else (c.index[0][1], 'weak') if c.get(0) - c.get(1, default=0) == 1 else np.nan)(x.value_counts())).apply(pd.Series)).dropna()
 
-	df = df.rename(columns={0:'label', 1: 'agreement'}).reset_index()
-	df.label = df.label.map({'True':1, 'False':0})
+############################### ######### ###############################
 
-	df2 = df.copy()
+@traced('pretrain_BERT')
+def pretrain_BERT(model_path, use_cuda=False, corpora=CORPORA):
+	model_args = LanguageModelingArgs()
+	model_args.fp16 = False
+	model_args.dataset_class = ShardListDataset
+	model = LanguageModelingModel('bert', model_path, use_cuda=use_cuda, args=model_args)
 
-	df = pd.concat([df1, df2])
-	df.to_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t', index=False)
+	#token blocks are prepared once per tokenizer of the model and reused across runs
+	model.train_model(prepare_corpus(model.tokenizer, corpora, block_size=model.args.block_size))
 
 
-############################### ######### ###############################
+def BERT_fold(model_path, X, y, train_index, test_index, use_cuda=False):
+	df_train = pd.DataFrame({'sentence': X[train_index], 'label': y[train_index]})
 
-def pretrain_BERT(model_path, use_cuda=False):
-	filename = '_df.csv' 
-	df = pd.read_csv(sciclops_dir+'etc/million_headlines/abcnews.csv').drop('publish_date', axis=1)
-	df.to_csv(filename, index=None, header=False)
 	model_args = LanguageModelingArgs()
 	model_args.fp16 = False
-	model = LanguageModelingModel('bert', model_path, use_cuda=use_cuda, args=model_args)
-	model.train_model(filename)
-	os.remove(filename)
+	model = ClassificationModel('bert', model_path, use_cuda=use_cuda, args=model_args)
+	model.train_model(df_train, args={'overwrite_output_dir':True})
 
+	y_pred, _ = model.predict(list(X[test_index]))
+	return y_pred
 
-def evaluate_BERT(model_path, training_set, use_cuda=False, crowd_evaluation=False):
+def RF_fold(X, y, train_index, test_index, seed=SEED, n_jobs=-1):
+	model = RandomForestClassifier(random_state=seed, n_jobs=n_jobs)
+	model.fit(X[train_index], y[train_index])
+	return model.predict(X[test_index])
+
+@traced('evaluate_BERT')
+def evaluate_BERT(model_path, training_set, use_cuda=False, crowd_evaluation=False, stratified=True, workers=1):
 
 	if crowd_evaluation:
+		start = time.perf_counter()
 		df = pd.read_csv(training_set, sep='\t')
 
 		model_args = LanguageModelingArgs()
@@ -132,94 +224,55 @@ def evaluate_BERT(model_path, training_set, use_cuda=False, crowd_evaluation=Fal
 		model = ClassificationModel('bert', model_path, use_cuda=use_cuda, args=model_args)
 		model.train_model(df[['sentence', 'label']], args={'overwrite_output_dir':True})
 
-		for crowd_agreement in ['strong', 'weak']:
-			df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t')
-			df = df[(df.agreement == crowd_agreement)]
-			df['pred'], _ = model.predict(df['sentence'].to_list())
-			result = precision_recall_fscore_support(df['label'], df['pred'], average='binary')
-			with open ('results.txt', 'a+') as f: f.write ('Model Path: '+ model_path + '\nTraining set: '+ training_set + '\nCrowd Agreement: '+ crowd_agreement + '\nResult: ' + str(result)+'\n\n\n')
+		df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t')
+		df['pred'], _ = model.predict(df['sentence'].to_list())
+		crowd_results(df, model_path, training_set, time.perf_counter() - start)
 
 	else:
 		df = pd.read_csv(training_set, sep='\t')
 		X = df['sentence'].values
 		y = df['label'].values
-		
-		fold = 5
-		kf = KFold(n_splits=fold, shuffle=True)
-		
-		score = 0.0
-		for train_index, test_index in kf.split(X):
-
-			X_train, X_test = X[train_index], X[test_index]
-			y_train, y_test = y[train_index], y[test_index]
 
-			df_train = pd.DataFrame([X_train, y_train]).T.rename(columns={0:'sentence', 1:'label'})
-			df_test = pd.DataFrame([X_test, y_test]).T.rename(columns={0:'sentence', 1:'label'})
+		#one fine-tuning per fold; keep workers=1 when folds would share a GPU
+		results = cross_validate(BERT_fold, X, y, args=(model_path,), kwargs={'use_cuda': use_cuda}, stratified=stratified, workers=workers)
+		write_result({'model': model_path, 'training_set': training_set, **results})
 
-			model_args = LanguageModelingArgs()
-			model_args.fp16 = False
-			model = ClassificationModel('bert', model_path, use_cuda=use_cuda, args=model_args)
-			model.train_model(df_train, args={'overwrite_output_dir':True})
 
-			df_test['pred'], _ = model.predict(df_test['sentence'].to_list())
-
-			score += accuracy_score(list(df_test['label']), list(df_test['pred']))
-
-		with open ('results.txt', 'a+') as f: f.write ('Model Path: '+ model_path + '\nTraining set: '+ training_set + '\nResult: ' + str(score/fold)+'\n\n\n')
-
-
-def evaluate_RF(training_set, crowd_evaluation=False):
+@traced('evaluate_RF')
+def evaluate_RF(training_set, crowd_evaluation=False, stratified=True, workers=None):
 
 	if crowd_evaluation:
+		start = time.perf_counter()
 		df = pd.read_csv(training_set, sep='\t')
-		df['vec'] = df['sentence'].apply(lambda s: nlp(s).vector)
-		X = np.array(df['vec'].to_list())
-		y = np.array(df['label'].to_list())
+		X = embed(df['sentence'].to_list())
+		y = df['label'].values
 
-		model = RandomForestClassifier(random_state=42)
+		model = RandomForestClassifier(random_state=SEED, n_jobs=-1)
 		model.fit(X, y)
-	
-		for crowd_agreement in ['strong', 'weak']:
-			df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t')
-			df = df[(df.agreement == crowd_agreement)]
-			df['vec'] = df['sentence'].apply(lambda s: nlp(s).vector)
-			X = np.array(df['vec'].to_list())
-			df['pred'] = model.predict(X)
-			
-			result = precision_recall_fscore_support(df['label'], df['pred'], average='binary')
-			with open ('results.txt', 'a+') as f: f.write ('Model Path: Random Forest' + '\nTraining set: '+ training_set + '\nCrowd Agreement: '+ crowd_agreement + '\nResult: ' + str(result)+'\n\n\n')
+
+		df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t')
+		df['pred'] = model.predict(embed(df['sentence'].to_list()))
+		crowd_results(df, 'Random Forest', training_set, time.perf_counter() - start)
 
 	else:
 		df = pd.read_csv(training_set, sep='\t')
-		df['vec'] = df['sentence'].apply(lambda s: list(nlp(s).vector))
-		X = np.array(df['vec'].to_list())
-		y = np.array(df['label'].to_list())
-		
-		fold = 5
-		kf = KFold(n_splits=fold, shuffle=True)
-		
-		score = 0.0
-		for train_index, test_index in kf.split(X):
-
-			X_train, X_test = X[train_index], X[test_index]
-			y_train, y_test = y[train_index], y[test_index]
-
-			model = RandomForestClassifier(random_state=42)
-			model.fit(X_train, y_train)
-
-			y_pred = model.predict(X_test)
-
-			score += accuracy_score(list(y_test), list(y_pred))
+		X = embed(df['sentence'].to_list())
+		y = df['label'].values
 
-		with open ('results.txt', 'a+') as f: f.write ('Model Path: Random Forest' + '\nTraining set: '+ training_set + '\nResult: ' + str(score/fold)+'\n\n\n')
+		#folds run in parallel, so each forest gets its share of the cores
+		fold = 5
+		n_jobs = max(1, (os.cpu_count() or 1) // (workers or fold))
+		results = cross_validate(RF_fold, X, y, kwargs={'n_jobs': n_jobs}, fold=fold, stratified=stratified, workers=workers)
+		write_result({'model': 'Random Forest', 'training_set': training_set, **results})
 
 
+@traced('use_BERT')
 def use_BERT(model_path, use_cuda=False):
 	model_args = LanguageModelingArgs()
 	model_args.fp16 = False
 	model = ClassificationModel('bert', model_path, use_cuda=use_cuda, args=model_args)
 
-	articles = pd.read_csv(scilens_dir + 'article_details_v3.tsv.bz2', sep='\t')
+	articles = read_source('articles', ['url', 'title', 'quotes'])
 	titles = articles[['url', 'title']].drop_duplicates(subset='url').rename(columns={'title': 'claim'})
 	articles = articles[['url', 'quotes']].drop_duplicates(subset='url')
 	articles.quotes = articles.quotes.apply(lambda l: list(map(lambda d: d['quote'], eval(l))))
@@ -227,7 +280,8 @@ def use_BERT(model_path, use_cuda=False):
 	articles = pd.concat([articles, titles])
 	articles = articles[~articles['claim'].isna()]
 
-	articles['label'], _ = model.predict(articles.claim)
+	with span('use_BERT/predict', items=len(articles), unit='sentences'):
+		articles['label'], _ = model.predict(articles.claim)
 
 	articles = articles[articles.label == 1].drop('label', axis=1)
 	articles = articles.groupby('url')['claim'].apply(list).reset_index()
@@ -262,6 +316,7 @@ def baseline(sentence, baseline_type):
 
 
 	def max_lift(sentence):
+		articles, tweets, G = lift_data()
 
 		article_url = list(articles[articles['title'].str.find(sentence) != -1].dropna().index) + list(articles[articles['full_text'].str.find(sentence) != -1].dropna().index)
 
@@ -294,19 +349,18 @@ def baseline(sentence, baseline_type):
 	elif baseline_type == 'both_and':
 		return max_lift(sentence) and pattern_search(sentence)
 
+@traced('evaluate_baseline')
 def evaluate_baseline(training_set, baseline_type, crowd_evaluation=False):
-	if crowd_evaluation:	
-		for crowd_agreement in ['strong', 'weak']:
-			df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t')
-			df = df[(df.agreement == crowd_agreement)]
-			df['pred'] = df['sentence'].apply(lambda s: baseline(s, baseline_type))
-			result = precision_recall_fscore_support(df['label'], df['pred'], average='binary')
-			with open ('results.txt', 'a+') as f: f.write ('Model Path: '+ baseline_type + '\nTraining set: '+ training_set + '\nCrowd Agreement: '+ crowd_agreement + '\nResult: ' + str(result)+'\n\n\n')
+	start = time.perf_counter()
+	if crowd_evaluation:
+		df = pd.read_csv(sciclops_dir + 'etc/arguments/mturk_results_full.tsv', sep='\t')
+		df['pred'] = df['sentence'].apply(lambda s: baseline(s, baseline_type))
+		crowd_results(df, baseline_type, training_set, time.perf_counter() - start)
 	else:
 		df = pd.read_csv(training_set, sep='\t')
 		df['pred'] = df['sentence'].apply(lambda s: baseline(s, baseline_type))
 		score = accuracy_score(list(df['label']), list(df['pred']))
-		with open ('results.txt', 'a+') as f: f.write ('Model Path: '+ baseline_type + '\nTraining set: '+ training_set + '\nResult: ' + str(score)+'\n\n\n')
+		write_result({'model': baseline_type, 'training_set': training_set, 'accuracy': score, 'seconds': time.perf_counter() - start})
 
 
 
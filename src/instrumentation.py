@@ -0,0 +1,151 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+############################### CONSTANTS ###############################
+#JSON lines file that every finished span is appended to
+TRACE_FILE = os.getenv('SCICLOPS_TRACE')
+#Chrome trace (chrome://tracing, Perfetto) written at exit, of at most the last MAX_SPANS spans
+CHROME_TRACE_FILE = os.getenv('SCICLOPS_CHROME_TRACE')
+MAX_SPANS = 100000
+#comma-separated span names (or 'all') to run under cProfile, and optionally py-spy
+PROFILE = set(filter(None, os.getenv('SCICLOPS_PROFILE', '').split(',')))
+PROFILE_DIR = os.getenv('SCICLOPS_PROFILE_DIR', 'profiles')
+PYSPY = os.getenv('SCICLOPS_PYSPY', '0') == '1'
+#print every span to stderr
+VERBOSE = os.getenv('SCICLOPS_VERBOSE', '0') == '1'
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+#finished spans, kept only for the Chrome trace
+spans = deque(maxlen=MAX_SPANS)
+local = threading.local()
+
+def rss_mb():
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+	except OSError:
+		return None
+
+def peak_rss_mb():
+	#ru_maxrss is in kilobytes on Linux and in bytes on macOS
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+def profiled(name):
+	return 'all' in PROFILE or name in PROFILE
+
+#Sampling profile of this process for the duration of a span, if py-spy is installed
+def start_pyspy(name):
+	if not (PYSPY and shutil.which('py-spy')):
+		return None
+	os.makedirs(PROFILE_DIR, exist_ok=True)
+	return subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()), '--format', 'speedscope', '--output', os.path.join(PROFILE_DIR, name.replace('/', '_') + '.speedscope.json')], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+#py-spy writes its output when interrupted
+def stop_pyspy(process):
+	if process is not None:
+		process.send_signal(signal.SIGINT)
+		process.wait()
+
+class Span:
+	def __init__(self, name, items=None, unit='items', **attributes):
+		self.name = name
+		self.items = items
+		self.unit = unit
+		self.attributes = attributes
+
+	def count(self, items):
+		self.items = (self.items or 0) + items
+
+	def record(self):
+		record = {'name': self.name, 'parent': self.parent, 'pid': os.getpid(), 'tid': threading.get_ident(), 'start': self.start, 'seconds': self.wall, 'cpu_seconds': self.cpu, 'rss_start_mb': self.rss_start, 'rss_end_mb': self.rss_end, 'peak_rss_mb': self.peak_rss}
+		if self.items is not None:
+			record['items'] = self.items
+			record[self.unit + '_per_second'] = self.items / self.wall if self.wall else None
+		record.update(self.attributes)
+		return record
+
+############################### ######### ###############################
+
+#Time a pipeline stage: wall and CPU time, memory and item throughput
+@contextmanager
+def span(name, items=None, unit='items', **attributes):
+	s = Span(name, items, unit, **attributes)
+	stack = local.__dict__.setdefault('stack', [])
+	s.parent = stack[-1].name if stack else None
+	stack.append(s)
+
+	if VERBOSE:
+		print('  ' * (len(stack) - 1) + name + '...', file=sys.stderr)
+
+	#profilers cannot be nested, so only the outermost profiled span gets one
+	profiling = profiled(name) and not getattr(local, 'profiling', False)
+	profiler = cProfile.Profile() if profiling else None
+	pyspy = start_pyspy(name) if profiling else None
+	local.profiling = getattr(local, 'profiling', False) or profiling
+	s.start, s.rss_start = time.time(), rss_mb()
+	wall, cpu = time.perf_counter(), time.process_time()
+	if profiler:
+		profiler.enable()
+	try:
+		yield s
+	finally:
+		if profiler:
+			profiler.disable()
+		s.wall, s.cpu = time.perf_counter() - wall, time.process_time() - cpu
+		s.rss_end, s.peak_rss = rss_mb(), peak_rss_mb()
+		stop_pyspy(pyspy)
+		if profiling:
+			local.profiling = False
+		if profiler:
+			os.makedirs(PROFILE_DIR, exist_ok=True)
+			profiler.dump_stats(os.path.join(PROFILE_DIR, name.replace('/', '_') + '.prof'))
+		stack.pop()
+
+		record = s.record()
+		if CHROME_TRACE_FILE:
+			spans.append(record)
+		if TRACE_FILE:
+			with open(TRACE_FILE, 'a') as f: f.write(json.dumps(record, default=float) + '\n')
+		if VERBOSE:
+			rate = ', {:.1f} {}/s'.format(record[s.unit + '_per_second'], s.unit) if s.items and s.wall else ''
+			print('  ' * len(stack) + '{} done in {:.1f}s (cpu {:.1f}s, peak rss {:.0f}MB{})'.format(name, s.wall, s.cpu, s.peak_rss, rate), file=sys.stderr)
+
+#Decorator form of span; the name defaults to module.function
+def traced(name=None):
+	def decorator(fn):
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			with span(name or fn.__module__ + '.' + fn.__name__):
+				return fn(*args, **kwargs)
+		return wrapper
+	return decorator
+
+#Finished spans in the Chrome trace event format
+def export_chrome_trace(trace_file, records=None):
+	events = [{'name': r['name'], 'ph': 'X', 'ts': r['start'] * 1.e6, 'dur': r['seconds'] * 1.e6, 'pid': r['pid'], 'tid': r['tid'], 'args': {k: v for k, v in r.items() if k not in ['name', 'start', 'seconds', 'pid', 'tid']}} for r in (spans if records is None else records)]
+	with open(trace_file, 'w') as f: json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=float)
+
+#Convert a JSON lines trace (e.g. of a multi-process run) into a Chrome trace
+def jsonl_to_chrome_trace(jsonl_file, trace_file):
+	export_chrome_trace(trace_file, [json.loads(l) for l in open(jsonl_file) if l.strip()])
+
+if CHROME_TRACE_FILE:
+	atexit.register(lambda: export_chrome_trace(CHROME_TRACE_FILE))
+
+
+if __name__ == "__main__":
+	jsonl_to_chrome_trace(sys.argv[1], sys.argv[2])
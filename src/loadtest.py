@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+
+URL = 'http://localhost:8080'
+REQUESTS = 2000
+CONCURRENCY = 16
+#share of requests drawn from a small hot set, to exercise the result cache
+REPEAT_RATE = 0.5
+HOT_CLAIMS = 50
+SEED = 42
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+#Claims to query: the evaluation claims, then the clustered claims
+def sample_claims(num, seed=SEED):
+	claims = pd.read_csv(sciclops_dir + 'etc/evaluation/raw_claims.csv')['Scientific Claim'].dropna().tolist()
+	if os.path.exists(sciclops_dir + 'cache/claims_clusters.tsv.bz2'):
+		claims += pd.read_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t', usecols=['claim'])['claim'].dropna().tolist()
+	claims = list(dict.fromkeys(claims))
+	random.Random(seed).shuffle(claims)
+	return claims[:num]
+
+def workload(claims, num_requests, repeat_rate=REPEAT_RATE, seed=SEED):
+	rng = random.Random(seed)
+	hot = claims[:HOT_CLAIMS]
+	cold = iter(claims[HOT_CLAIMS:] * (num_requests // max(1, len(claims) - HOT_CLAIMS) + 1))
+	return [rng.choice(hot) if rng.random() < repeat_rate else next(cold) for _ in range(num_requests)]
+
+def percentiles(latencies):
+	return {'p' + str(p): 1.e3 * float(np.percentile(latencies, p)) for p in [50, 90, 99]} if latencies else {}
+
+############################### ######### ###############################
+
+#Closed-loop load: `concurrency` clients, each sending its next request as soon as the last one returns
+def load_test(url=URL, num_requests=REQUESTS, concurrency=CONCURRENCY, repeat_rate=REPEAT_RATE, max_related=3):
+	queries = workload(sample_claims(num_requests), num_requests, repeat_rate)
+
+	session = requests.Session()
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+	session.mount('http://', adapter)
+
+	latencies, errors, lock = [], [], threading.Lock()
+	def query(claim):
+		start = time.perf_counter()
+		try:
+			response = session.post(url + '/context', json={'claim': claim, 'max_related': max_related}, timeout=30)
+			response.raise_for_status()
+			with lock: latencies.append(time.perf_counter() - start)
+		except requests.RequestException as e:
+			with lock: errors.append(str(e))
+
+	#warm-up request, so that lazily loaded data is not counted
+	query(queries[0])
+	latencies.clear()
+
+	start = time.perf_counter()
+	with ThreadPoolExecutor(concurrency) as executor:
+		list(executor.map(query, queries))
+	seconds = time.perf_counter() - start
+
+	stats = session.get(url + '/stats', timeout=30).json()
+	session.close()
+	return {'requests': num_requests, 'concurrency': concurrency, 'repeat_rate': repeat_rate, 'seconds': seconds, 'requests_per_second': len(latencies) / seconds, 'errors': len(errors), 'latency_ms': percentiles(latencies), 'server': stats, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Load-test the local claim-context service.')
+	parser.add_argument('--url', default=URL)
+	parser.add_argument('--requests', type=int, default=REQUESTS)
+	parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+	parser.add_argument('--repeat-rate', type=float, default=REPEAT_RATE)
+	parser.add_argument('--output', default='loadtest.json')
+	args = parser.parse_args()
+
+	report = load_test(args.url, args.requests, args.concurrency, args.repeat_rate)
+	print('{requests_per_second:.0f} req/s, {errors} errors, '.format(**report) + ', '.join('{} {:.1f}ms'.format(k, v) for k, v in report['latency_ms'].items()), file=sys.stderr)
+	json.dump(report, open(args.output, 'w'), indent=1)
@@ -0,0 +1,260 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from sources import SCHEMAS, input_stamp
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+src_dir = os.path.dirname(os.path.abspath(__file__)) + '/'
+config_file = src_dir + 'pipeline.json'
+
+pipeline_dir = sciclops_dir + 'cache/pipeline/'
+objects_dir = pipeline_dir + 'objects/'
+manifests_dir = pipeline_dir + 'manifests/'
+outputs_dir = pipeline_dir + 'outputs/'
+work_dir = pipeline_dir + 'work/'
+
+#caches shared by all stages rather than versioned as artifacts
+SHARED_CACHES = ['vectors', 'corpus', 'sources']
+#caches derived from upstream artifacts, rebuilt inside each workspace
+PRIVATE_CACHES = ['pipeline', 'ann']
+#stores that stages write to, copied into each workspace rather than linked
+MUTABLE_CACHES = ['claimskg.db', 'claimbuster.db']
+#files read at import time by the modules of the stages
+MODULE_INPUTS = {
+	'extracting': ['etc/hn_vocabulary/hn_vocabulary.txt', 'etc/keywords'],
+	'clustering': ['etc/hn_vocabulary/hn_vocabulary.txt'],
+	'contextualizing': ['etc/hn_vocabulary'],
+}
+WORKERS = 2
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+class Stage:
+	def __init__(self, name, module, function, kwargs={}, globals={}, deps=[], outputs=[], paths=[], inputs=[]):
+		self.name = name
+		self.module = module
+		self.function = function
+		self.kwargs = kwargs
+		self.globals = globals
+		self.deps = deps
+		#files the stage writes, relative to sciclops_dir
+		self.outputs = outputs
+		#kwargs holding paths relative to sciclops_dir
+		self.paths = paths
+		#external files or directories the stage reads, relative to sciclops_dir or absolute
+		self.inputs = MODULE_INPUTS.get(module, []) + inputs
+
+def file_hash(path):
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(2**20), b''):
+			h.update(block)
+	return h.hexdigest()
+
+#A module of src/ and the modules of src/ it imports, directly or not, at the top or inside functions
+def local_modules(module, found=None):
+	found = set() if found is None else found
+	found.add(module)
+	for node in ast.walk(ast.parse(open(src_dir + module + '.py').read())):
+		names = [a.name for a in node.names] if isinstance(node, ast.Import) else [node.module] if isinstance(node, ast.ImportFrom) and node.module else []
+		for name in names:
+			if name not in found and os.path.exists(src_dir + name + '.py'):
+				local_modules(name, found)
+	return found
+
+def code_hash(module):
+	return hashlib.sha256(''.join(m + file_hash(src_dir + m + '.py') for m in sorted(local_modules(module))).encode('utf-8')).hexdigest()
+
+#Stage key: its call, the code it runs, the stamps of its external inputs and the content hashes of everything it reads from upstream stages
+def stage_key(stage, upstream):
+	spec = {
+		'name': stage.name,
+		'call': [stage.module, stage.function, stage.kwargs, stage.globals],
+		'code': code_hash(stage.module),
+		'external': {p: input_stamp(p) for p in stage.inputs},
+		'inputs': {d: upstream[d] for d in stage.deps},
+	}
+	return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+def cached(key):
+	manifest = manifests_dir + key + '.json'
+	if not os.path.exists(manifest):
+		return None
+	manifest = json.load(open(manifest))
+	return manifest if all(os.path.exists(objects_dir + h) for h in manifest['outputs'].values()) else None
+
+#The stages declared by a config
+def build_dag(config):
+	stages = []
+
+	if config.get('claims'):
+		stages += [Stage('claims', 'extracting', 'use_BERT', {'model_path': config['claims']['model_path'], 'use_cuda': config['claims'].get('use_cuda', False)}, outputs=['cache/claims_raw.tsv.bz2'], inputs=[SCHEMAS['articles']['file'], config['claims']['model_path']])]
+
+	matrices, clustering, context = config['matrices'], config['clustering'], config['context']
+	outputs = ['cache/cooc.npz', 'cache/cooc_papers.txt', 'cache/claims_dedup.tsv.bz2', 'cache/matrices.json']
+	for representation in matrices['representations']:
+		outputs += ['cache/'+m+'_'+representation+'.tsv.bz2' for m in ['papers', 'claims']]
+		if representation == 'embeddings':
+			outputs += ['cache/'+m+'_'+representation+'_'+str(d)+'.tsv.bz2' for m in ['papers', 'claims'] for d in matrices.get('pca_dimensions') or []]
+	#without a claims stage, the extracted claims are an external input
+	inputs = [SCHEMAS[s]['file'] for s in ['graph', 'papers', 'tweets']] + ['small_files/blacklist/sources.txt'] + ([] if config.get('claims') else ['cache/claims_raw.tsv.bz2'])
+	stages += [Stage('matrices', 'clustering', 'matrix_preparation', {'representations': matrices['representations'], 'pca_dimensions': matrices.get('pca_dimensions'), 'dedup_threshold': matrices.get('dedup_threshold')}, globals={'precision': clustering.get('hyperparameters', {}).get('precision', 'float32')}, deps=['claims'] if config.get('claims') else [], outputs=outputs, inputs=inputs)]
+
+	#clustering stages check the matrices against the threshold they were prepared with
+	for k in clustering['num_clusters']:
+		stages += [Stage('clustering-'+str(k), 'clustering', 'cache_clusterings', {'clustering_type': clustering['clustering_type'], 'init_clustering_method': clustering['init_clustering_method']}, globals={'NUM_CLUSTERS': k, 'DEDUP_THRESHOLD': matrices.get('dedup_threshold'), **clustering.get('hyperparameters', {})}, deps=['matrices'], outputs=['cache/papers_clusters.tsv.bz2', 'cache/claims_clusters.tsv.bz2'])]
+		stages += [Stage('context-'+str(k), 'contextualizing', 'enhance_context', {'max_related': context['max_related'], 'ann_candidates': context.get('ann_candidates', 0)}, globals={'NUM_CLUSTERS': k, 'LAMBDA': context['lambda']}, deps=['clustering-'+str(k)] + (['matrices'] if context.get('ann_candidates') else []), outputs=['evaluation/claims_enhanced_context.csv'], inputs=['etc/claimKG/claims.csv', 'cache/claimskg.db', 'etc/news_outlets/acsh.tsv', SCHEMAS['paper_texts']['file']])]
+
+	#evaluations do not depend on the clustering branch and run next to it
+	evaluation = config.get('evaluation', {})
+	for i, training_set in enumerate(evaluation.get('training_sets', [])):
+		for crowd_evaluation in evaluation.get('crowd_evaluation', [False]):
+			suffix = '-' + str(i) + ('-crowd' if crowd_evaluation else '')
+			inputs = [training_set] + (['etc/arguments/mturk_results_full.tsv'] if crowd_evaluation else [])
+			if evaluation.get('random_forest'):
+				stages += [Stage('evaluate-rf'+suffix, 'extracting', 'evaluate_RF', {'training_set': training_set, 'crowd_evaluation': crowd_evaluation}, outputs=['results.jsonl'], paths=['training_set'], inputs=inputs)]
+			for j, model_path in enumerate(evaluation.get('bert_models', [])):
+				stages += [Stage('evaluate-bert-'+str(j)+suffix, 'extracting', 'evaluate_BERT', {'model_path': model_path, 'training_set': training_set, 'use_cuda': evaluation.get('use_cuda', False), 'crowd_evaluation': crowd_evaluation}, outputs=['results.jsonl'], paths=['training_set'], inputs=inputs)]
+			for baseline_type in evaluation.get('baselines', []):
+				stages += [Stage('evaluate-'+baseline_type+suffix, 'extracting', 'evaluate_baseline', {'training_set': training_set, 'baseline_type': baseline_type, 'crowd_evaluation': crowd_evaluation}, outputs=['results.jsonl'], paths=['training_set'], inputs=inputs + ([SCHEMAS[s]['file'] for s in ['articles', 'tweets', 'graph']] if baseline_type != 'pattern_only' else []))]
+
+	return {s.name: s for s in stages}
+
+#A private copy of sciclops_dir for one stage: external inputs are linked, upstream artifacts are linked from the store
+def prepare_workspace(stage, workspace, upstream_outputs):
+	shutil.rmtree(workspace, ignore_errors=True)
+	os.makedirs(workspace)
+	for entry in os.listdir(sciclops_dir):
+		if entry not in ['cache', 'evaluation']:
+			os.symlink(sciclops_dir + entry, workspace + entry)
+
+	for d in ['cache', 'evaluation']:
+		os.makedirs(workspace + d)
+		if os.path.isdir(sciclops_dir + d):
+			for entry in os.listdir(sciclops_dir + d):
+				if d == 'cache' and entry in MUTABLE_CACHES:
+					shutil.copy2(sciclops_dir + d + '/' + entry, workspace + d + '/' + entry)
+				elif not (d == 'cache' and entry in PRIVATE_CACHES):
+					os.symlink(sciclops_dir + d + '/' + entry, workspace + d + '/' + entry)
+
+	for path, h in upstream_outputs.items():
+		if os.path.lexists(workspace + path):
+			os.remove(workspace + path)
+		os.symlink(objects_dir + h, workspace + path)
+
+	#never write through a link into the real data directory
+	for path in stage.outputs:
+		if os.path.lexists(workspace + path):
+			os.remove(workspace + path)
+
+def run_stage(stage, key, upstream_outputs):
+	workspace = work_dir + key + '/'
+	prepare_workspace(stage, workspace, upstream_outputs)
+
+	script = '\n'.join([
+		'import json, os, sys',
+		'import ' + stage.module + ' as m',
+		'config = json.loads(sys.argv[1])',
+		'for k, v in config["globals"].items(): setattr(m, k, v)',
+		'kwargs = config["kwargs"]',
+		'for k in config["paths"]: kwargs[k] = os.environ["SCICLOPS_DIR"] + kwargs[k]',
+		'm.' + stage.function + '(**kwargs)',
+	])
+	env = dict(os.environ, SCICLOPS_DIR=workspace, PYTHONPATH=src_dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+	start = time.perf_counter()
+	with open(workspace + 'stage.log', 'w') as log:
+		process = subprocess.run([sys.executable, '-c', script, json.dumps({'globals': stage.globals, 'kwargs': stage.kwargs, 'paths': stage.paths})], env=env, cwd=workspace, stdout=log, stderr=subprocess.STDOUT)
+	if process.returncode != 0:
+		raise RuntimeError('stage ' + stage.name + ' failed, see ' + workspace + 'stage.log')
+
+	outputs = {}
+	for path in stage.outputs:
+		h = file_hash(workspace + path)
+		if not os.path.exists(objects_dir + h):
+			shutil.move(workspace + path, objects_dir + h)
+		outputs[path] = h
+
+	manifest = {'stage': stage.name, 'key': key, 'outputs': outputs, 'seconds': time.perf_counter() - start, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+	json.dump(manifest, open(manifests_dir + key + '.json', 'w'), indent=1)
+	shutil.rmtree(workspace)
+	return manifest
+
+#Link the outputs of every stage under outputs/<stage>/
+def publish(manifests):
+	for name, manifest in manifests.items():
+		for path, h in manifest['outputs'].items():
+			link = outputs_dir + name + '/' + path
+			os.makedirs(os.path.dirname(link), exist_ok=True)
+			if os.path.lexists(link):
+				os.remove(link)
+			os.symlink(objects_dir + h, link)
+
+############################### ######### ###############################
+
+#Run the stale stages of the DAG, independent stages in parallel
+def run(config, targets=None, workers=WORKERS, dry_run=False):
+	stages = build_dag(config)
+	for d in [objects_dir, manifests_dir, outputs_dir, work_dir]:
+		os.makedirs(d, exist_ok=True)
+	for d in SHARED_CACHES:
+		os.makedirs(sciclops_dir + 'cache/' + d, exist_ok=True)
+
+	#restrict to the targets and everything they depend on
+	if targets:
+		needed, queue = set(), list(targets)
+		while queue:
+			name = queue.pop()
+			if name not in needed:
+				needed.add(name)
+				queue += stages[name].deps
+		stages = {n: s for n, s in stages.items() if n in needed}
+
+	manifests, running = {}, {}
+	with ThreadPoolExecutor(workers) as executor:
+		while len(manifests) < len(stages):
+			for name, stage in stages.items():
+				if name in manifests or name in running.values() or not all(d in manifests for d in stage.deps):
+					continue
+				upstream_outputs = {p: h for d in stage.deps for p, h in manifests[d]['outputs'].items()}
+				key = stage_key(stage, {d: manifests[d]['outputs'] for d in stage.deps})
+				manifest = cached(key)
+				if manifest or dry_run:
+					print(name + (': up to date' if manifest else ': stale'), file=sys.stderr)
+					manifests[name] = manifest or {'outputs': {p: 'stale' for p in stage.outputs}}
+				else:
+					print(name + ': running', file=sys.stderr)
+					running[executor.submit(run_stage, stage, key, upstream_outputs)] = name
+
+			if not running:
+				continue
+			done, _ = wait(running, return_when=FIRST_COMPLETED)
+			for future in done:
+				name = running.pop(future)
+				manifests[name] = future.result()
+				print(name + ': done in {:.1f}s'.format(manifests[name]['seconds']), file=sys.stderr)
+
+	if not dry_run:
+		publish(manifests)
+	return manifests
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Run the stale stages of the SciClops pipeline.')
+	parser.add_argument('targets', nargs='*', help='stages to bring up to date (default: all)')
+	parser.add_argument('--config', default=config_file)
+	parser.add_argument('--workers', type=int, default=WORKERS)
+	parser.add_argument('--dry-run', action='store_true', help='only report which stages are stale')
+	args = parser.parse_args()
+
+	run(json.load(open(args.config)), args.targets, args.workers, args.dry_run)
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import sqlite3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import spacy
+
+from ann import load_index
+from batching import MAX_RELATED, Batcher, LRUCache
+from claimskg import ClaimsKG
+from contextualizing import health, hn_vocabulary, topic_pairs, weighted_claims
+from instrumentation import span
+from sources import read_source
+
+############################### CONSTANTS ###############################
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+
+PORT = 8080
+MAX_TOPICS = 5
+#topic pairs whose fact-checks are kept with their vectors
+FACTCHECK_CACHE_SIZE = 1000
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+def normalize(vectors):
+	vectors = np.asarray(vectors, dtype=np.float32)
+	norm = np.linalg.norm(vectors, axis=-1, keepdims=True)
+	return np.divide(vectors, norm, out=np.zeros_like(vectors), where=norm>0)
+
+def terms(text):
+	return set(str(text).split()).intersection(hn_vocabulary)
+
+#Term -> row ids of the documents containing it
+def term_index(texts):
+	index = {}
+	for i, text in enumerate(texts):
+		for t in terms(text):
+			index.setdefault(t, []).append(i)
+	return {t: np.array(ids) for t, ids in index.items()}
+
+#Top-k (item, similarity) of the candidate rows by cosine similarity to the query
+def top_k(query, vectors, rows, items, k):
+	if not len(rows):
+		return []
+	scores = vectors[rows] @ query
+	top = min(k, len(rows))
+	best = np.argpartition(-scores, top-1)[:top] if top < len(rows) else np.arange(top)
+	best = best[np.argsort(-scores[best], kind='stable')]
+	return [items[rows[i]] + [float(scores[i])] for i in best]
+
+#Normalized vectors of an ANN index for (text, url) items; items it does not hold get a zero vector
+def stored_vectors(index, items):
+	position = {item: i for i, item in enumerate(index.items.itertuples(index=False, name=None))}
+	vectors = np.concatenate([index.vectors(), np.zeros((1, index.dim), dtype=np.float32)])
+	return vectors[[position.get(tuple(item), len(index)) for item in items]]
+
+############################### ######### ###############################
+
+#Clusters, term indexes, embeddings and ClaimsKG, loaded once; answers batches of claims
+class ContextIndex:
+	def __init__(self, num_clusters=None, max_topics=MAX_TOPICS):
+		with span('service/loading'):
+			self.nlp = spacy.load('en_core_web_lg')
+			self.max_topics = max_topics
+
+			claims_clusters = pd.read_csv(sciclops_dir + 'cache/claims_clusters.tsv.bz2', sep='\t')
+			num_clusters = num_clusters or sum(c.isdigit() for c in claims_clusters.columns)
+			claims_clusters = weighted_claims(claims_clusters, num_clusters)
+			papers = pd.read_csv(sciclops_dir + 'cache/papers_clusters.tsv.bz2', sep='\t', usecols=['url', 'title']).merge(read_source('paper_texts', ['url', 'full_text']), on='url')
+
+			#the topic pairs of the clusters, most central first
+			self.pairs = topic_pairs(claims_clusters, num_clusters)
+
+			self.claims = claims_clusters[['claim', 'url']].values.tolist()
+			self.papers = papers[['title', 'url']].values.tolist()
+			self.claims_terms = term_index(claims_clusters['claim'])
+			self.papers_terms = term_index(papers['full_text'])
+			#the vectors stored with the claims and papers indexes, instead of embedding every text again;
+			#near-duplicate claims share the vector of their canonical claim
+			canonical = {}
+			if os.path.exists(sciclops_dir + 'cache/claims_dedup.tsv.bz2'):
+				mapping = pd.read_csv(sciclops_dir + 'cache/claims_dedup.tsv.bz2', sep='\t', keep_default_na=False)
+				canonical = {(c, u): (cc, cu) for c, u, cc, cu in mapping[['claim', 'url', 'canonical_claim', 'canonical_url']].values}
+			self.claims_vectors = stored_vectors(load_index('claims'), [canonical.get((c, u), (c, u)) for c, u in self.claims])
+			self.papers_vectors = stored_vectors(load_index('papers'), self.papers)
+
+			#fact-checks matching a pair, with their vectors, for the most recent pairs
+			self.factchecks = LRUCache(FACTCHECK_CACHE_SIZE)
+			self.kg = None
+
+	def embed(self, texts):
+		return normalize(np.array([d.vector for d in self.nlp.pipe(texts, disable=self.nlp.pipe_names)], dtype=np.float32).reshape(len(texts), self.nlp.vocab.vectors_length))
+
+	#ClaimsKG copied into memory; sqlite connections stay in the thread that opened them
+	def claims_kg(self):
+		if self.kg is None:
+			store = ClaimsKG()
+			if not len(store):
+				store.ingest(sciclops_dir+'etc/claimKG/claims.csv')
+			memory = sqlite3.connect(':memory:')
+			store.db.backup(memory)
+			store.close()
+			store.db = memory
+			self.kg = store
+		return self.kg
+
+	def pair_factchecks(self, pair):
+		factchecks = self.factchecks.get(pair)
+		if factchecks is None:
+			rows = [list(r) for r in self.claims_kg().search(list(pair))]
+			factchecks = (rows, self.embed([r[0] for r in rows]))
+			self.factchecks.put(pair, factchecks)
+		return factchecks
+
+	#Topic pairs of a claim: the cluster pairs it mentions, or else pairs of its own health/non-health terms
+	def claim_pairs(self, claim):
+		claim_terms = terms(claim)
+		pairs = [p for p in self.pairs if p[0] in claim_terms and p[1] in claim_terms]
+		if not pairs:
+			pairs = sorted((e1, e2) for e1 in claim_terms for e2 in claim_terms if e1 in health and e2 not in health)
+		return list(dict.fromkeys(pairs))[:self.max_topics]
+
+	def related(self, index, pair):
+		if pair[0] not in index or pair[1] not in index:
+			return np.array([], dtype=int)
+		return np.intersect1d(index[pair[0]], index[pair[1]])
+
+	def context(self, claims, max_related=MAX_RELATED):
+		queries = self.embed(claims)
+		results = []
+		for claim, query in zip(claims, queries):
+			pairs = self.claim_pairs(claim)
+			claims_rows = np.unique(np.concatenate([self.related(self.claims_terms, p) for p in pairs] or [[]])).astype(int)
+			papers_rows = np.unique(np.concatenate([self.related(self.papers_terms, p) for p in pairs] or [[]])).astype(int)
+
+			factchecks, vectors, seen = [], [], set()
+			for p in pairs:
+				rows, v = self.pair_factchecks(p)
+				for r, vector in zip(rows, v):
+					if tuple(r) not in seen:
+						seen.add(tuple(r))
+						factchecks += [r]
+						vectors += [vector]
+
+			results += [{
+				'claim': claim,
+				'topics': [p[0]+'-'+p[1] for p in pairs],
+				'claims': top_k(query, self.claims_vectors, claims_rows, self.claims, max_related),
+				'papers': top_k(query, self.papers_vectors, papers_rows, self.papers, max_related),
+				'factchecks': top_k(query, np.array(vectors), np.arange(len(factchecks)), factchecks, max_related),
+			}]
+		return results
+
+############################### ######### ###############################
+
+#POST /context with {"claim": ...} or {"claims": [...]}, optionally "max_related"; GET /stats
+def serve(port=PORT, num_clusters=None):
+	batcher = Batcher(ContextIndex(num_clusters))
+
+	class Handler(BaseHTTPRequestHandler):
+		#keep-alive connections; every reply carries its Content-Length
+		protocol_version = 'HTTP/1.1'
+
+		def reply(self, status, body):
+			body = json.dumps(body).encode('utf-8')
+			self.send_response(status)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def do_GET(self):
+			if self.path == '/stats':
+				self.reply(200, batcher.stats())
+			else:
+				self.reply(404, {'error': 'not found'})
+
+		def do_POST(self):
+			if self.path != '/context':
+				return self.reply(404, {'error': 'not found'})
+			try:
+				request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+				claims = request['claims'] if 'claims' in request else [request['claim']]
+				max_related = int(request.get('max_related', MAX_RELATED))
+				if not isinstance(claims, list) or not all(isinstance(c, str) for c in claims) or max_related < 1:
+					raise ValueError
+			except (ValueError, KeyError, TypeError):
+				return self.reply(400, {'error': 'expected {"claim": ...} or {"claims": [...]} of strings, and a max_related of at least 1'})
+			try:
+				results = batcher.context(claims, max_related)
+			except Exception as e:
+				return self.reply(500, {'error': str(e)})
+			self.reply(200, results if 'claims' in request else results[0])
+
+		def log_message(self, *args):
+			pass
+
+	class Server(ThreadingHTTPServer):
+		daemon_threads = True
+		request_queue_size = 1024
+
+	server = Server(('localhost', port), Handler)
+	print('serving on http://localhost:' + str(port), flush=True)
+	server.serve_forever()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Serve the related claims, papers and fact-checks of any claim.')
+	parser.add_argument('--port', type=int, default=PORT)
+	parser.add_argument('--clusters', type=int, help='number of clusters (default: inferred from cache/claims_clusters.tsv.bz2)')
+	args = parser.parse_args()
+
+	serve(args.port, args.clusters)
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import networkx as nx
+import pandas as pd
+
+from instrumentation import span
+
+############################### CONSTANTS ###############################
+scilens_dir = os.getenv('SCILENS_DIR', str(Path.home()) + '/data/scilens/cache/diffusion_graph/scilens_3M/')
+sciclops_dir = os.getenv('SCICLOPS_DIR', str(Path.home()) + '/data/sciclops/')
+mirror_dir = sciclops_dir + 'cache/sources/'
+
+#one-time Parquet mirror of every source, if pyarrow is installed
+MIRROR = os.getenv('SCICLOPS_MIRROR', '1') == '1'
+#parallel bz2 decompressors, in order of preference
+BZIP2_TOOLS = ['lbzip2', 'pbzip2']
+CHUNKSIZE = 100000
+
+#columns and dtypes of the sources; only the requested columns are ever parsed
+SCHEMAS = {
+	'articles': {'file': scilens_dir + 'article_details_v3.tsv.bz2', 'dtype': {'url': str, 'title': str, 'full_text': str, 'quotes': str}},
+	#counts may be written as floats ("3.0") or be missing: they are parsed as floats and loaded as int64, missing as 0
+	'tweets': {'file': scilens_dir + 'tweet_details_v1.tsv.bz2', 'dtype': {'url': str, 'full_text': str, 'popularity': 'float64'}, 'counts': ['popularity']},
+	'papers': {'file': scilens_dir + 'paper_details_v1.tsv.bz2', 'dtype': {'url': str, 'title': str, 'full_text': str}},
+	'paper_texts': {'file': sciclops_dir + 'cache/paper_details_v1.tsv.bz2', 'dtype': {'url': str, 'title': str, 'full_text': str}},
+	#urls repeat across edges, so both ends are categoricals
+	'graph': {'file': scilens_dir + 'diffusion_graph_v7.tsv.bz2', 'dtype': {'source': 'category', 'target': 'category'}, 'header': None},
+}
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+def parallel_bzip2():
+	return next((t for t in BZIP2_TOOLS if shutil.which(t)), None)
+
+def arrow_type(dtype):
+	import pyarrow as pa
+	return {'category': pa.dictionary(pa.int32(), pa.string()), 'float64': pa.float64()}.get(dtype, pa.string())
+
+#Chunks of a bz2 TSV source, decompressed by lbzip2/pbzip2 on all cores when available
+def csv_chunks(name, columns, chunksize):
+	schema = SCHEMAS[name]
+	header = schema.get('header', 'infer')
+	kwargs = {'sep': '\t', 'usecols': columns, 'dtype': {c: schema['dtype'][c] for c in columns}, 'chunksize': chunksize, 'header': header}
+	if header is None:
+		kwargs['names'] = list(schema['dtype'])
+
+	tool = parallel_bzip2()
+	if tool is None:
+		yield from pd.read_csv(schema['file'], **kwargs)
+		return
+	process = subprocess.Popen([tool, '-dc', schema['file']], stdout=subprocess.PIPE)
+	try:
+		yield from pd.read_csv(process.stdout, **kwargs)
+	finally:
+		process.stdout.close()
+		process.wait()
+
+def source_stamp(name):
+	stat = os.stat(SCHEMAS[name]['file'])
+	return {'size': stat.st_size, 'mtime': stat.st_mtime, 'columns': {c: str(t) for c, t in SCHEMAS[name]['dtype'].items()}}
+
+#Size and mtime of an input file (relative to sciclops_dir, or absolute), of every file under a directory, or None if missing
+def input_stamp(path):
+	path = path if os.path.isabs(path) else sciclops_dir + path
+	if os.path.isdir(path):
+		return {str(p.relative_to(path)): input_stamp(str(p)) for p in sorted(Path(path).rglob('*')) if p.is_file()}
+	if not os.path.exists(path):
+		return None
+	stat = os.stat(path)
+	return [stat.st_size, stat.st_mtime]
+
+def fill_counts(df, name):
+	for c in SCHEMAS[name].get('counts', []):
+		if c in df:
+			df[c] = df[c].fillna(0).astype('int64')
+	return df
+
+#The Parquet mirror of a source, converted once and again only when the source changes
+def mirror(name):
+	if not MIRROR:
+		return None
+	try:
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+	except ImportError:
+		return None
+
+	parquet_file = mirror_dir + name + '.parquet'
+	stamp_file = mirror_dir + name + '.json'
+	stamp = source_stamp(name)
+	if os.path.exists(parquet_file) and os.path.exists(stamp_file) and json.load(open(stamp_file)) == stamp:
+		return parquet_file
+
+	os.makedirs(mirror_dir, exist_ok=True)
+	dtype = SCHEMAS[name]['dtype']
+	schema = pa.schema([(c, arrow_type(t)) for c, t in dtype.items()])
+	#concurrent readers only ever see a complete mirror
+	tmp_file = parquet_file + '.' + str(os.getpid())
+	with span('sources/mirror:'+name, unit='rows') as stage:
+		with pq.ParquetWriter(tmp_file, schema) as writer:
+			for chunk in csv_chunks(name, list(dtype), CHUNKSIZE):
+				writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+				stage.count(len(chunk))
+	os.replace(tmp_file, parquet_file)
+	json.dump(stamp, open(stamp_file, 'w'))
+	return parquet_file
+
+############################### ######### ###############################
+
+#Iterate over a source in chunks of `chunksize` rows, parsing only `columns`
+def iter_source(name, columns=None, chunksize=CHUNKSIZE):
+	dtype = SCHEMAS[name]['dtype']
+	columns = columns or list(dtype)
+	parquet_file = mirror(name)
+	if parquet_file is None:
+		yield from (fill_counts(chunk, name) for chunk in csv_chunks(name, columns, chunksize))
+		return
+
+	import pyarrow.parquet as pq
+	for batch in pq.ParquetFile(parquet_file).iter_batches(batch_size=chunksize, columns=columns):
+		yield fill_counts(batch.to_pandas().astype({c: dtype[c] for c in columns}), name)
+
+#Load `columns` of a source, optionally deduplicated on `unique`
+def read_source(name, columns=None, unique=None):
+	columns = columns or list(SCHEMAS[name]['dtype'])
+	with span('sources/read:'+name, unit='rows', columns=columns) as stage:
+		parquet_file = mirror(name)
+		if parquet_file is None:
+			df = pd.concat(csv_chunks(name, columns, CHUNKSIZE), ignore_index=True)
+		else:
+			df = pd.read_parquet(parquet_file, columns=columns).astype({c: SCHEMAS[name]['dtype'][c] for c in columns})
+		df = fill_counts(df, name)
+		if unique:
+			df = df.drop_duplicates(subset=unique)
+		stage.count(len(df))
+	return df
+
+#Diffusion graph
+def read_graph():
+	edges = read_source('graph')
+	return nx.from_pandas_edgelist(edges, 'source', 'target', create_using=nx.DiGraph())
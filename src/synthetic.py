@@ -0,0 +1,154 @@
+import argparse
+import os
+import random
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+############################### CONSTANTS ###############################
+EDGES = 10000
+VOCABULARY_SIZE = 500
+FILLER_SIZE = 2000
+OUTLETS = 50
+#rows generated and written at a time
+CHUNKSIZE = 1000
+COMPLETE = '.complete'
+SEED = 42
+############################### ######### ###############################
+
+################################ HELPERS ################################
+
+#Pronounceable pseudo-words ending in a vowel, so that lemmatization leaves them untouched
+def pseudo_words(num, rng):
+	consonants, vowels = 'bdfgklmnprtvz', 'aiou'
+	words = set()
+	while len(words) < num:
+		words.add(''.join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4))))
+	return sorted(words)
+
+def sentence(rng, vocabulary, filler, length=(12, 20), terms=(2, 4)):
+	words = rng.sample(filler, rng.randint(*length)) + rng.sample(vocabulary, rng.randint(*terms))
+	rng.shuffle(words)
+	return ' '.join(words).capitalize() + '.'
+
+#Chunks after the first are appended, as further bz2 streams and without a header
+def write(df, path, append=False, **kwargs):
+	Path(path).parent.mkdir(parents=True, exist_ok=True)
+	if append:
+		kwargs.update(mode='a', header=False)
+	df.to_csv(path, **kwargs)
+
+def chunks(num, chunksize=CHUNKSIZE):
+	return [range(i, min(i + chunksize, num)) for i in range(0, num, chunksize)]
+
+############################### ######### ###############################
+
+#SciLens/SciClops-shaped corpus whose diffusion graph has about `edges` edges
+def generate(output_dir, edges=EDGES, seed=SEED):
+	rng = random.Random(seed)
+	np_rng = np.random.default_rng(seed)
+	scilens_dir = output_dir + '/scilens/'
+	sciclops_dir = output_dir + '/sciclops/'
+
+	#about 8 tweet->article and 2 article->paper edges per article
+	num_articles = max(10, edges // 10)
+	num_papers = max(10, num_articles // 2)
+	num_tweets = max(10, num_articles * 4)
+
+	words = pseudo_words(VOCABULARY_SIZE + FILLER_SIZE + 3 * 20, rng)
+	rng.shuffle(words)
+	vocabulary, filler, keywords = words[:VOCABULARY_SIZE], words[VOCABULARY_SIZE:VOCABULARY_SIZE+FILLER_SIZE], words[VOCABULARY_SIZE+FILLER_SIZE:]
+	health = vocabulary[:VOCABULARY_SIZE // 2]
+	outlets = ['outlet' + str(i) + '.com' for i in range(OUTLETS)]
+
+	for name, terms in [('etc/hn_vocabulary/hn_vocabulary.txt', vocabulary), ('etc/hn_vocabulary/health.txt', health), ('etc/keywords/action.txt', keywords[:20]), ('etc/keywords/person.txt', keywords[20:40]), ('etc/keywords/study.txt', keywords[40:]), ('small_files/blacklist/sources.txt', [])]:
+		Path(sciclops_dir + name).parent.mkdir(parents=True, exist_ok=True)
+		open(sciclops_dir + name, 'w').write('\n'.join(terms))
+
+	article_url = lambda i: 'http://www.' + outlets[i % OUTLETS] + '/article/' + str(i)
+	paper_url = lambda i: 'http://doi.org/10.0000/' + str(i)
+	tweet_url = lambda i: 'http://twitter.com/user/status/' + str(i)
+
+	#diffusion graph: tweets -> articles -> papers, two edges per source in the chunk of its source
+	graph_file = scilens_dir + 'diffusion_graph_v7.tsv.bz2'
+	for c in chunks(num_tweets):
+		graph_edges = pd.DataFrame({0: [tweet_url(i) for i in c for _ in range(2)], 1: [article_url(j) for j in np_rng.integers(0, num_articles, 2 * len(c))]})
+		write(graph_edges.drop_duplicates(), graph_file, c.start > 0, sep='\t', header=False, index=False)
+	for c in chunks(num_articles):
+		graph_edges = pd.DataFrame({0: [article_url(i) for i in c for _ in range(2)], 1: [paper_url(j) for j in np_rng.integers(0, num_papers, 2 * len(c))]})
+		write(graph_edges.drop_duplicates(), graph_file, True, sep='\t', header=False, index=False)
+
+	for c in chunks(num_articles):
+		urls = [article_url(i) for i in c]
+		claims = [[sentence(rng, vocabulary, filler) for _ in range(rng.randint(1, 3))] for _ in c]
+		articles = pd.DataFrame({
+			'url': urls,
+			'title': [t[0] for t in claims],
+			'full_text': ['\n'.join(' '.join(sentence(rng, vocabulary, filler) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(8, 15))) for _ in c],
+			'quotes': [str([{'quote': q} for q in t[1:]]) for t in claims],
+		})
+		write(articles, scilens_dir + 'article_details_v3.tsv.bz2', c.start > 0, sep='\t', index=False)
+		write(pd.DataFrame({'url': urls, 'claim': [str(t) for t in claims]}), sciclops_dir + 'cache/claims_raw.tsv.bz2', c.start > 0, sep='\t', index=False)
+		if c.start == 0:
+			write(pd.DataFrame({'Scientific Claim': [t[0] for t in claims[:100]], 'URL': urls[:100]}), sciclops_dir + 'etc/evaluation/raw_claims.csv', index=False)
+
+	for c in chunks(num_tweets):
+		tweets = pd.DataFrame({'url': [tweet_url(i) for i in c], 'full_text': [sentence(rng, vocabulary, filler, (5, 10), (1, 2)) for _ in c], 'popularity': np_rng.zipf(2.0, len(c))})
+		write(tweets, scilens_dir + 'tweet_details_v1.tsv.bz2', c.start > 0, sep='\t', index=False)
+
+	for c in chunks(num_papers):
+		papers = pd.DataFrame({'url': [paper_url(i) for i in c], 'title': [sentence(rng, vocabulary, filler, (4, 8), (2, 4))[:-1] for _ in c], 'full_text': ['\n'.join(sentence(rng, vocabulary, filler) for _ in range(5)) for _ in c]})
+		write(papers, scilens_dir + 'paper_details_v1.tsv.bz2', c.start > 0, sep='\t', index=False)
+		write(papers, sciclops_dir + 'cache/paper_details_v1.tsv.bz2', c.start > 0, sep='\t', index=False)
+
+	write(pd.DataFrame({'outlet': outlets, 'rate': np_rng.uniform(0, 10, OUTLETS).round(1)}), sciclops_dir + 'etc/news_outlets/acsh.tsv', sep='\t', index=False)
+	write(pd.DataFrame({'claimText': [sentence(rng, vocabulary, filler, (6, 12)) for _ in range(num_papers)], 'claimKeywords': '', 'rating': [rng.choice(['TRUE', 'FALSE']) for _ in range(num_papers)], 'claimEntities': ''}), sciclops_dir + 'etc/claimKG/claims.csv', index=False)
+	write(pd.DataFrame({'publish_date': 20200101, 'headline_text': [sentence(rng, vocabulary, filler, (4, 8), (1, 2))[:-1].lower() for _ in range(num_articles)]}), sciclops_dir + 'etc/million_headlines/abcnews.csv', index=False)
+
+	#labelled sentences and MTurk-style results
+	num_sentences = max(100, num_articles // 10)
+	workers = ['W' + str(i) for i in range(max(10, num_sentences // 20))]
+	for c in chunks(num_sentences):
+		sentences = [sentence(rng, vocabulary, filler) for _ in c]
+		labels = np_rng.integers(0, 2, len(c))
+		write(pd.DataFrame({'sentence': sentences, 'label': labels}), sciclops_dir + 'etc/arguments/UKP_IBM.tsv', c.start > 0, sep='\t', index=False)
+		write(pd.DataFrame({'sentence': sentences, 'label': labels}), sciclops_dir + 'etc/arguments/UKP_IBM_full.tsv', c.start > 0, sep='\t', index=False)
+
+		answers = [(s, l, rng.choice(workers), l if rng.random() < .8 else 1 - l) for s, l in zip(sentences, labels) for _ in range(rng.randint(3, 5))]
+		write(pd.DataFrame({
+			'Input.sentence': [a[0] for a in answers],
+			'Input.golden_label': [a[1] for a in answers],
+			'Input.type': 'synthetic',
+			'Answer.claim.label': ['Yes' if a[3] else 'No' for a in answers],
+			'LifetimeApprovalRate': [rng.choice(['0% (0/0)', '97% (97/100)', '100% (10/10)']) for _ in answers],
+			'WorkerId': [a[2] for a in answers],
+		}), sciclops_dir + 'etc/arguments/mturk_results_old.csv', c.start > 0, index=False)
+		write(pd.DataFrame({
+			'Input.sentence': [a[0] for a in answers],
+			'Answer.False.False': [a[3] == 0 for a in answers],
+			'Answer.NA.NA': False,
+			'Answer.True.True': [a[3] == 1 for a in answers],
+			'WorkerId': [a[2] for a in answers],
+		}), sciclops_dir + 'etc/arguments/mturk_results.csv', c.start > 0, index=False)
+
+	for d in ['models', 'evaluation']:
+		os.makedirs(sciclops_dir + d, exist_ok=True)
+
+	#written last, so that an interrupted generation is never taken for a corpus
+	open(output_dir + '/' + COMPLETE, 'w').write(str(edges))
+	return scilens_dir, sciclops_dir
+
+def generated(output_dir):
+	return os.path.exists(output_dir + '/' + COMPLETE)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Generate a synthetic SciLens/SciClops corpus.')
+	parser.add_argument('output_dir')
+	parser.add_argument('--edges', type=int, default=EDGES)
+	parser.add_argument('--seed', type=int, default=SEED)
+	args = parser.parse_args()
+
+	scilens_dir, sciclops_dir = generate(args.output_dir, args.edges, args.seed)
+	print('export SCILENS_DIR=' + scilens_dir + ' SCICLOPS_DIR=' + sciclops_dir)
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from batching import Batcher, LRUCache
+
+
+#Answers a batch with one result per claim, failing the whole batch on a 'bad' claim
+class Index:
+	def __init__(self):
+		self.calls = []
+		self.release = threading.Event()
+		self.release.set()
+
+	def context(self, claims, max_related):
+		self.release.wait()
+		self.calls += [list(claims)]
+		if 'bad' in claims:
+			raise ValueError('bad claim')
+		return [{'claim': c, 'max_related': max_related} for c in claims]
+
+def test_lru_cache():
+	cache = LRUCache(2)
+	cache.put('a', 1)
+	cache.put('b', 2)
+	assert cache.get('a') == 1
+	cache.put('c', 3)
+	assert cache.get('b') is None
+	assert (cache.hits, cache.misses) == (1, 1)
+
+def test_bad_claim_fails_alone():
+	index = Index()
+	index.release.clear()
+	batcher = Batcher(index, batch_wait=0.1)
+	futures = [batcher.submit(c) for c in ['first', 'bad', 'second']]
+	index.release.set()
+	assert futures[0].result(timeout=5)['claim'] == 'first'
+	assert futures[2].result(timeout=5)['claim'] == 'second'
+	with pytest.raises(ValueError):
+		futures[1].result(timeout=5)
+	#a failed claim is not cached, the others are
+	assert batcher.cache.get(('bad', 3)) is None
+	assert batcher.cache.get(('first', 3)) is not None
+
+def test_pending_requests_are_shared():
+	index = Index()
+	index.release.clear()
+	batcher = Batcher(index, batch_wait=0.1)
+	first, second = batcher.submit('claim'), batcher.submit('claim')
+	assert first is second
+	assert batcher.submit('claim', 5) is not first
+	index.release.set()
+	assert first.result(timeout=5) == {'claim': 'claim', 'max_related': 3}
+	assert batcher.context(['claim']) == [first.result()]
+	assert sum(c.count('claim') for c in index.calls) == 2
+	assert not batcher.pending
@@ -0,0 +1,46 @@
+import threading
+import time
+
+import pytest
+
+from claimbuster import ClaimBuster, RateLimiter, stub_server
+
+
+def test_rate_limiter_below_one_per_second():
+	limiter = RateLimiter(0.5)
+	start = time.monotonic()
+	limiter.wait()
+	assert time.monotonic() - start < 0.1
+
+def test_rate_limiter_throughput():
+	limiter = RateLimiter(20)
+	limiter.tokens = 0
+	start = time.monotonic()
+	for _ in range(10):
+		limiter.wait()
+	assert 0.4 < time.monotonic() - start < 1.0
+
+@pytest.fixture
+def stub():
+	server = stub_server(0)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	yield 'http://localhost:' + str(server.server_address[1]) + '/'
+	server.shutdown()
+	server.server_close()
+
+def test_score_and_cache(stub, tmp_path):
+	client = ClaimBuster(endpoint=stub, cache_file=str(tmp_path / 'claimbuster.db'), rate_limit=1000, backoff=0)
+	responses = client.score(['a claim', 'another claim', 'a claim'])
+	assert [r['results'][0]['text'] for r in responses] == ['a claim', 'another claim', 'a claim']
+	assert client.cached('a claim') == responses[0]
+
+	#the same claim against another endpoint is not served from the cache
+	other = ClaimBuster(endpoint=stub + 'other', cache_file=str(tmp_path / 'claimbuster.db'))
+	assert other.cached('a claim') is None
+	client.close()
+	other.close()
+
+def test_unreachable_endpoint_scores_none(tmp_path):
+	client = ClaimBuster(endpoint='http://localhost:9/', cache_file=str(tmp_path / 'claimbuster.db'), rate_limit=1000, max_retries=1, backoff=0, timeout=1)
+	assert client.score(['a claim']) == [None]
+	client.close()
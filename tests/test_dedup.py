@@ -0,0 +1,40 @@
+import pandas as pd
+
+from dedup import collapse, contract, expand, near_duplicates
+
+
+def claims():
+	return pd.DataFrame({
+		'url': ['a', 'b', 'c', 'd', 'e'],
+		'claim': ['Coffee drinkers live longer than tea drinkers, a new study finds.', 'Coffee drinkers live longer than tea drinkers, a new study finds!', 'Vaccines do not cause autism in young children, researchers say.', 'Vaccines do not cause autism in young children, researchers say.', 'Red wine protects the heart according to a small trial.'],
+		'popularity': [1, 5, 2, 3, 7],
+		'refs': [{'p1'}, {'p2'}, {'p3'}, {'p3', 'p4'}, {'p5'}],
+	})
+
+def test_near_duplicates():
+	groups = near_duplicates(claims()['claim'].tolist())
+	assert groups[0] == groups[1]
+	assert groups[2] == groups[3]
+	assert len(set(groups)) == 3
+
+def test_collapse():
+	canonical, mapping = collapse(claims())
+	assert canonical['url'].tolist() == ['b', 'd', 'e']
+	assert canonical['popularity'].tolist() == [6, 5, 7]
+	assert canonical['refs'].tolist() == [{'p1', 'p2'}, {'p3', 'p4'}, {'p5'}]
+	assert len(mapping) == 5
+
+def test_no_threshold_keeps_every_claim():
+	canonical, _ = collapse(claims(), None)
+	assert len(canonical) == 5
+
+def test_expand_contract_round_trip():
+	canonical, mapping = collapse(claims())
+	clusters = canonical.set_index(['url', 'claim', 'popularity'])[[]].assign(**{'0': [.9, .2, .5], '1': [.1, .8, .5]})
+
+	expanded = expand(clusters, mapping)
+	assert sorted(expanded.index.get_level_values('url')) == ['a', 'b', 'c', 'd', 'e']
+	assert expanded.loc['a', '0'].item() == .9
+
+	contracted = contract(expanded.reset_index(), mapping)
+	pd.testing.assert_frame_equal(contracted.sort_values('url').reset_index(drop=True), clusters.reset_index(), check_like=True)